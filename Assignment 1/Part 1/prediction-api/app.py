@@ -1,11 +1,14 @@
 import os
+import threading
 
-from flask import Flask, request
+from flask import Flask, request, jsonify
 
 from heart_disease_predictor import HeartDiseasePredictor
+from model_watcher import ModelWatcher
 
 app = Flask(__name__)
-app.config["DEBUG"] = True
+# debug mode (and the reloader) only for local development: FLASK_DEBUG=1 python app.py
+app.config["DEBUG"] = os.getenv("FLASK_DEBUG", "0") == "1"
 
 
 @app.route('/heart_predictor/', methods=['POST']) # path of the endpoint. Accept only HTTP POST request
@@ -15,8 +18,52 @@ def predict_str():
     return hdp.predict_single_record(prediction_inout)
 
 
+@app.route('/heart_predictor/batch', methods=['POST'])
+def predict_batch():
+    # a JSON list of any number of records, scored with a single forward pass
+    prediction_input = request.get_json()
+    return hdp.predict_batch(prediction_input)
+
+
+@app.route('/heart_predictor/cache', methods=['GET'])
+def cache_stats():
+    # hit/miss counters of this worker's prediction cache
+    if hdp.cache is None:
+        return jsonify({'enabled': False}), 200
+    return jsonify({'enabled': True, **hdp.cache.stats()}), 200
+
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    # readiness probe: only healthy once the model is loaded and warmed up (always healthy in lazy mode)
+    is_ready = hdp.warmed_up or startup_mode == 'lazy'
+    body = {'ready': is_ready, 'model_loaded': hdp.loaded is not None, 'warmed_up': hdp.warmed_up}
+    if hdp.loaded is not None:
+        body['model_version'] = hdp.loaded.version
+    return jsonify(body), 200 if is_ready else 503
+
+
+def start_model():
+    # eager (default): load and warm up the model before the server starts, so no request pays for a cold model
+    # background: start serving at once and warm up on a separate thread, /ready reports 503 until it is done
+    # lazy: load the model on the first request
+    if startup_mode == 'eager':
+        hdp.warm_up()
+    elif startup_mode == 'background':
+        threading.Thread(target=hdp.warm_up, name='model-warm-up', daemon=True).start()
+    # hot reload: a new model in MODEL_REPO is loaded and swapped in without a restart (0 turns it off)
+    watch_interval = float(os.getenv('MODEL_WATCH_INTERVAL_SECONDS', 30))
+    if watch_interval > 0:
+        ModelWatcher(hdp, watch_interval, os.getenv('MODEL_VERSION_FILE')).start()
+
+
 hdp = HeartDiseasePredictor()
+startup_mode = os.getenv('STARTUP_MODE', 'eager')
+# under gunicorn the model is loaded in each worker after the fork instead (see post_fork in gunicorn.conf.py)
+if os.getenv('MODEL_LOAD_AFTER_FORK', '0') != '1':
+    start_model()
 # The code within this conditional block will only run the python file is executed as a
 # script. See https://realpython.com/if-name-main-python/
+# In production the app is served by gunicorn instead, see gunicorn.conf.py
 if __name__ == '__main__':
-    app.run(port=int(os.getenv("PORT", 5000)), host='0.0.0.0', debug=True)
+    app.run(port=int(os.getenv("PORT", 5000)), host='0.0.0.0', debug=app.config["DEBUG"])
@@ -0,0 +1,35 @@
+# Microbenchmark of request parsing, comparing the old pandas JSON round trip with request_decoder.decode_records
+# Usage: python benchmark_decoder.py [number of records per request ...]
+import json
+import sys
+import timeit
+from io import StringIO
+
+import numpy as np
+import pandas as pd
+
+from request_decoder import decode_records
+
+
+def pandas_path(prediction_input):
+    # what predict_single_record did before: re-serialize the parsed JSON and parse it again with pandas
+    df = pd.read_json(StringIO(json.dumps(prediction_input)), orient='records')
+    return df.values.astype(np.float64)
+
+
+def main():
+    with open('test_prediction.json') as f:
+        record = json.load(f)[0]
+    sizes = [int(n) for n in sys.argv[1:]] or [1, 64, 1000]
+    print(f"{'records':>8} {'pandas (us)':>14} {'decoder (us)':>14} {'speed-up':>9}")
+    for n in sizes:
+        prediction_input = [dict(record) for _ in range(n)]
+        assert np.array_equal(pandas_path(prediction_input), decode_records(prediction_input))
+        number = max(10, 10000 // n)
+        pandas_us = min(timeit.repeat(lambda: pandas_path(prediction_input), number=number, repeat=5)) / number * 1e6
+        decoder_us = min(timeit.repeat(lambda: decode_records(prediction_input), number=number, repeat=5)) / number * 1e6
+        print(f"{n:>8} {pandas_us:>14.1f} {decoder_us:>14.1f} {pandas_us / decoder_us:>8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
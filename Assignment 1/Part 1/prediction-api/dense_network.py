@@ -0,0 +1,101 @@
+import io
+import json
+import zipfile
+
+import numpy as np
+
+
+def _relu(x):
+    return np.maximum(x, 0, out=x)
+
+
+def _sigmoid(x):
+    # numerically stable form, exp() never sees a large positive argument
+    out = np.exp(-np.abs(x))
+    return np.where(x >= 0, 1 / (1 + out), out / (1 + out))
+
+
+def _linear(x):
+    return x
+
+
+ACTIVATIONS = {
+    'relu': _relu,
+    'sigmoid': _sigmoid,
+    'linear': _linear,
+}
+
+
+class DenseNetwork:
+    """Forward pass of a stack of Dense layers with plain NumPy matmuls.
+
+    For the 13-24-16-8-1 heart disease MLP this is a handful of microseconds per row, against the
+    milliseconds of fixed overhead that model.predict() pays on every call.
+    """
+
+    def __init__(self, layers):
+        # layers: list of (kernel, bias, activation name)
+        self.layers = []
+        for kernel, bias, activation in layers:
+            if activation not in ACTIVATIONS:
+                raise ValueError(f"Unsupported activation for NumPy inference: {activation}")
+            self.layers.append((np.ascontiguousarray(kernel, dtype=np.float32),
+                                np.ascontiguousarray(bias, dtype=np.float32),
+                                ACTIVATIONS[activation]))
+
+    @classmethod
+    def from_keras_model(cls, model):
+        layers = []
+        for layer in model.layers:
+            if type(layer).__name__ != 'Dense':
+                raise ValueError(f"Only Dense layers can be exported to NumPy, found {type(layer).__name__}")
+            kernel, bias = layer.get_weights()
+            layers.append((kernel, bias, layer.get_config()['activation']))
+        return cls(layers)
+
+    @classmethod
+    def from_keras_archive(cls, file_path):
+        """Reads the Dense layers of a Keras 3 .keras archive with zipfile and h5py, without TensorFlow.
+
+        config.json gives the layer order and activations. model.weights.h5 stores the variables of the n-th
+        layer of a class under layers/<class>[_<n>]/vars (dense, dense_1, ...), whatever the layer names.
+        """
+        import h5py
+
+        with zipfile.ZipFile(file_path) as archive:
+            config = json.loads(archive.read('config.json'))
+            weights_file = io.BytesIO(archive.read('model.weights.h5'))
+        if config.get('class_name') != 'Sequential':
+            raise ValueError(f"Only Sequential models can be read without Keras, found {config.get('class_name')}")
+        layers = []
+        with h5py.File(weights_file, 'r') as weights:
+            for i, layer in enumerate(l for l in config['config']['layers'] if l['class_name'] != 'InputLayer'):
+                if layer['class_name'] != 'Dense':
+                    raise ValueError(f"Only Dense layers can be read without Keras, found {layer['class_name']}")
+                variables = weights[f"layers/{'dense' if i == 0 else f'dense_{i}'}/vars"]
+                kernel = variables['0'][()]
+                bias = variables['1'][()] if layer['config'].get('use_bias', True) else np.zeros(kernel.shape[1])
+                if layers and layers[-1][0].shape[1] != kernel.shape[0]:
+                    raise ValueError(f"Layer {layer['config']['name']} does not fit the previous layer")
+                layers.append((kernel, bias, layer['config']['activation']))
+        return cls(layers)
+
+    def fold_standardization(self, mean, scale):
+        """Folds the StandardScaler step (X - mean) / scale into the first layer, in place.
+
+        (X - m) / s @ W + b == X @ (W / s[:, None]) + (b - (m / s) @ W), so the network takes raw features and
+        standardising them costs nothing per request.
+        """
+        kernel, bias, activation = self.layers[0]
+        mean = np.asarray(mean, dtype=np.float64)
+        scale = np.asarray(scale, dtype=np.float64)
+        kernel64 = kernel.astype(np.float64)
+        self.layers[0] = (np.ascontiguousarray(kernel64 / scale[:, None], dtype=np.float32),
+                          (bias - (mean / scale) @ kernel64).astype(np.float32),
+                          activation)
+
+    def predict(self, X):
+        out = np.asarray(X, dtype=np.float32)
+        for kernel, bias, activation in self.layers:
+            out = activation(out @ kernel + bias)
+        return out
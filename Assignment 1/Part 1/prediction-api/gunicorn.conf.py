@@ -0,0 +1,34 @@
+# Production serving configuration: gunicorn -c gunicorn.conf.py app:app
+# See https://docs.gunicorn.org/en/stable/settings.html
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', 5000)}"
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+# each worker serves requests on a pool of threads that share the worker's model
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+accesslog = '-'
+
+# Import app.py once in the master process, so the workers share the TensorFlow/Keras libraries (most of the
+# memory of a worker) copy-on-write instead of each importing them again.
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') == '1'
+# The TensorFlow runtime is not fork-safe: once the master has run an op, TensorFlow calls in the forked
+# workers hang. The master therefore only imports the libraries, and every worker loads and warms up the
+# model (a few KB of weights) in post_fork, before it accepts connections.
+os.environ['MODEL_LOAD_AFTER_FORK'] = '1'
+
+# Split the cores between the workers, so N workers x TensorFlow's default one-thread-per-core pools don't
+# oversubscribe the CPU. This file is executed before the app is imported, so the variables are in place
+# before TensorFlow and NumPy create their thread pools.
+_threads_per_worker = str(max(1, multiprocessing.cpu_count() // workers))
+os.environ.setdefault('TF_NUM_INTRAOP_THREADS', _threads_per_worker)
+os.environ.setdefault('TF_NUM_INTEROP_THREADS', '1')
+for _blas_threads in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS'):
+    os.environ.setdefault(_blas_threads, _threads_per_worker)
+
+
+def post_fork(server, worker):
+    import app
+    app.start_model()
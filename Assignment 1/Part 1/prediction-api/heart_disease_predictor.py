@@ -1,33 +1,150 @@
-import json
 import os
+import threading
+import time
 
-import pandas as pd
+import numpy as np
 from flask import jsonify
-from keras.models import load_model
 import logging
-from io import StringIO
+
+from micro_batcher import MicroBatcher
+from model_backends import INFERENCE_MODES, MODEL_FILE_NAMES, MODEL_RUNTIMES, load_model_file
+from prediction_cache import PredictionCache
+from request_decoder import InvalidRecordError, decode_records
+
+_warned_model_repo = False
 
 
 class HeartDiseasePredictor:
     def __init__(self):
-        self.model = None
+        self.loaded = None
+        self.warmed_up = False
+        # MODEL_RUNTIME=keras serves .keras archives with Keras instead of reading their weights into NumPy
+        self.runtime = os.getenv('MODEL_RUNTIME', 'numpy')
+        if self.runtime not in MODEL_RUNTIMES:
+            raise ValueError(f"MODEL_RUNTIME must be one of {MODEL_RUNTIMES}, got {self.runtime}")
+        self.inference_mode = os.getenv('INFERENCE_MODE', 'numpy')
+        if self.inference_mode not in INFERENCE_MODES:
+            raise ValueError(f"INFERENCE_MODE must be one of {INFERENCE_MODES}, got {self.inference_mode}")
+        # larger inputs go through model.predict(), which batches them
+        self.fast_path_max_rows = int(os.getenv('FAST_PATH_MAX_ROWS', 256))
+        self._load_lock = threading.Lock()
+        # MICRO_BATCHING=1 coalesces concurrent small requests into one forward pass
+        self.batcher = None
+        if os.getenv('MICRO_BATCHING', '0') == '1':
+            self.batcher = MicroBatcher(self.predict_matrix,
+                                        max_batch_size=int(os.getenv('MICRO_BATCH_MAX_SIZE', 64)),
+                                        max_wait_ms=float(os.getenv('MICRO_BATCH_MAX_WAIT_MS', 2)))
+        # cache of model outputs for small requests, PREDICTION_CACHE_SIZE=0 turns it off
+        self.cache = None
+        if int(os.getenv('PREDICTION_CACHE_SIZE', 10000)) > 0:
+            self.cache = PredictionCache(max_size=int(os.getenv('PREDICTION_CACHE_SIZE', 10000)),
+                                         ttl_seconds=float(os.getenv('PREDICTION_CACHE_TTL_SECONDS', 3600)))
+        self.cache_max_rows = int(os.getenv('PREDICTION_CACHE_MAX_ROWS', 64))
+
+    @staticmethod
+    def model_path():
+        # MODEL_FILE picks the artifact explicitly, otherwise the first of MODEL_FILE_NAMES in MODEL_REPO
+        model_repo = os.getenv('MODEL_REPO')
+        if not model_repo:
+            # called on every poll of the model watcher, so reported once
+            global _warned_model_repo
+            if not _warned_model_repo:
+                logging.warning("MODEL_REPO is undefined, looking for the model in the working directory")
+                _warned_model_repo = True
+            model_repo = '.'
+        if os.getenv('MODEL_FILE'):
+            return os.path.join(model_repo, os.environ['MODEL_FILE'])
+        for file_name in MODEL_FILE_NAMES:
+            file_path = os.path.join(model_repo, file_name)
+            if os.path.exists(file_path):
+                return file_path
+        return os.path.join(model_repo, MODEL_FILE_NAMES[0])
+
+    def _load(self):
+        return load_model_file(self.model_path(), self.inference_mode, self.fast_path_max_rows, self.runtime)
+
+    def get_model(self):
+        if self.loaded is None:
+            # several request threads may hit a cold predictor at once, only one of them should load
+            with self._load_lock:
+                if self.loaded is None:
+                    self.loaded = self._load()
+        return self.loaded
+
+    def reload(self):
+        # Load and warm up the new model off the request path, then swap it in with a single assignment.
+        # Requests that already hold the old model object finish on it.
+        start = time.perf_counter()
+        with self._load_lock:
+            loaded = self._load()
+            loaded.warm_up()
+            previous, self.loaded = self.loaded, loaded
+        if self.cache is not None:
+            self.cache.clear()
+        logging.info("Reloaded %s (version %s -> %s) in %.2f s", loaded.file_path,
+                     previous.version if previous else None, loaded.version, time.perf_counter() - start)
+
+    def predict_matrix(self, X):
+        return self.get_model().predict(X)
+
+    def predict(self, X):
+        if self.cache is not None and len(X) <= self.cache_max_rows:
+            return self._predict_cached(X)
+        return self._predict_uncached(X)
+
+    def _predict_uncached(self, X):
+        if self.batcher is not None:
+            return self.batcher.predict(X)
+        return self.predict_matrix(X)
+
+    def _predict_cached(self, X):
+        # only the rows that are not in the cache go through the model. The model version is part of the key,
+        # so an output computed by an old model during a reload is never served for the new one.
+        loaded = self.get_model()
+        keys = [self.cache.key(row, loaded.version) for row in X]
+        y_pred = np.empty((len(X), 1), dtype=np.float32)
+        missing = []
+        for i, key in enumerate(keys):
+            value = self.cache.get(key)
+            if value is None:
+                missing.append(i)
+            else:
+                y_pred[i] = value
+        if missing:
+            y_missing = self._predict_uncached(X[missing])
+            y_pred[missing] = y_missing
+            for i, value in zip(missing, y_missing):
+                self.cache.put(keys[i], value)
+        return y_pred
+
+    def warm_up(self):
+        start = time.perf_counter()
+        self.get_model().warm_up()
+        self.warmed_up = True
+        logging.info("Model loaded and warmed up in %.2f s", time.perf_counter() - start)
 
     def predict_single_record(self, prediction_input):
         logging.debug(prediction_input)
-        if self.model is None:
-            try:
-                model_repo = os.environ['MODEL_REPO']
-                file_path = os.path.join(model_repo, "model.keras")
-                self.model = load_model(file_path)
-            except KeyError:
-                print("MODEL_REPO is undefined")
-                self.model = load_model('model.keras')
-
-        df = pd.read_json(StringIO(json.dumps(prediction_input)), orient='records')
-        y_pred = self.model.predict(df)
+        try:
+            X = decode_records(prediction_input)
+        except InvalidRecordError as e:
+            return jsonify({'message': f'Invalid input: {e}'}), 400
+
+        y_pred = self.predict(X)
         logging.info(y_pred[0])
         status = (y_pred[0] > 0.5)
         logging.info(type(status[0]))
         # return the prediction outcome as a json message. 200 is HTTP status code 200, indicating successful completion
         return jsonify({'result': str(status[0])}), 200
 
+    def predict_batch(self, prediction_input):
+        # one forward pass for the whole list of records instead of one HTTP call + predict() per patient
+        try:
+            X = decode_records(prediction_input)
+        except InvalidRecordError as e:
+            return jsonify({'message': f'Invalid input: {e}'}), 400
+
+        y_pred = self.predict(X)
+        logging.info("Scored %d records", len(y_pred))
+        status = (y_pred[:, 0] > 0.5)
+        return jsonify({'results': [str(s) for s in status]}), 200
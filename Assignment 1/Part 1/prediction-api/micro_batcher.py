@@ -0,0 +1,77 @@
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class MicroBatcher:
+    """Coalesces concurrent small prediction requests into one forward pass.
+
+    Request threads call predict(X) and block. A background thread takes the first waiting request, keeps
+    collecting requests until max_batch_size rows are queued or max_wait_ms has passed, runs predict_fn once
+    on the stacked rows and hands every request its own slice of the output. This trades at most
+    max_wait_ms of extra latency for one model call per batch instead of one per request.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=64, max_wait_ms=2.0):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._start_lock = threading.Lock()
+        self._worker_pid = None
+
+    def _ensure_worker(self):
+        # the thread is started on first use in each process, threads do not survive a gunicorn fork
+        if self._worker_pid != os.getpid():
+            with self._start_lock:
+                if self._worker_pid != os.getpid():
+                    self._queue = queue.Queue()
+                    threading.Thread(target=self._run, name='micro-batcher', daemon=True).start()
+                    self._worker_pid = os.getpid()
+
+    def predict(self, X):
+        # inputs that fill a batch on their own gain nothing from waiting
+        if len(X) >= self.max_batch_size:
+            return self.predict_fn(X)
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((X, future))
+        return future.result()
+
+    def _collect(self):
+        first = self._queue.get()
+        batch = [first]
+        n_rows = len(first[0])
+        deadline = time.perf_counter() + self.max_wait
+        while n_rows < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            n_rows += len(item[0])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                X = np.concatenate([X for X, _ in batch]) if len(batch) > 1 else batch[0][0]
+                y_pred = self.predict_fn(X)
+            except Exception as e:
+                logging.exception("Batched prediction of %d requests failed", len(batch))
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            start = 0
+            for X, future in batch:
+                future.set_result(y_pred[start:start + len(X)])
+                start += len(X)
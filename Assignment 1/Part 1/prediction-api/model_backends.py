@@ -0,0 +1,244 @@
+import json
+import logging
+import os
+import pickle
+
+import numpy as np
+
+from dense_network import DenseNetwork
+from request_decoder import FEATURE_NAMES, N_FEATURES
+
+# How .keras archives are served, selected with the MODEL_RUNTIME environment variable:
+#   numpy - read the Dense weights out of the archive and run the whole network with NumPy; TensorFlow is
+#           only imported if the model has other layers
+#   keras - load the model with Keras, small inputs go through the INFERENCE_MODE path below
+MODEL_RUNTIMES = ('numpy', 'keras')
+
+# Inference paths for small inputs of Keras models, selected with the INFERENCE_MODE environment variable:
+#   keras    - always call model.predict() (builds a tf.data pipeline on every call)
+#   function - call a traced tf.function of the model directly
+#   numpy    - run the Dense layers as NumPy matmuls
+INFERENCE_MODES = ('keras', 'function', 'numpy')
+
+# Model files looked up in MODEL_REPO, in order, when MODEL_FILE is not set. The manifest written by the
+# trainers points at a compact serving artifact and is preferred over the full .keras archive or pickle.
+MODEL_FILE_NAMES = ('model_manifest.json', 'model.keras', 'model.pkl')
+
+
+def model_version(file_path):
+    # identifies one version of the model file, changes when a new model is copied into MODEL_REPO
+    try:
+        stat = os.stat(file_path)
+        return f"{stat.st_mtime_ns}-{stat.st_size}"
+    except OSError:
+        return None
+
+
+def artifact_type(file_path):
+    # The compact artifacts are recognised by their extension (.npz is a zip like .keras, UBJSON and the JSON
+    # manifest both start with '{'). Otherwise decide from the first bytes rather than the file name: the
+    # training pipeline uploads whichever model wins, XGBoost pickles included, as model.keras
+    extension = os.path.splitext(file_path)[1]
+    if extension == '.json':
+        return 'manifest'
+    if extension == '.ubj':
+        return 'xgboost'
+    with open(file_path, 'rb') as f:
+        magic = f.read(4)
+    if magic.startswith(b'PK\x03\x04'):
+        return 'keras'
+    if magic.startswith(b'\x80'):
+        return 'xgboost'
+    raise ValueError(f"{file_path} is neither a .keras archive nor a pickled XGBoost model")
+
+
+class KerasModel:
+    """One loaded version of a Keras model together with its fast inference path.
+
+    The predictor swaps the whole object when a new model is loaded, so a request that already took a
+    reference finishes on the version it started with.
+    """
+
+    def __init__(self, file_path, inference_mode, fast_path_max_rows):
+        self.file_path = file_path
+        self.version = model_version(file_path)
+        self.inference_mode = inference_mode
+        self.fast_path_max_rows = fast_path_max_rows
+        # TensorFlow takes seconds to import and hundreds of MB, only pay for it when a Keras model is served
+        from keras.models import load_model
+        self.model = load_model(file_path)
+        self.fast_path = self._build_fast_path()
+
+    def _build_fast_path(self):
+        model = self.model
+        fast_path = None
+        if self.inference_mode == 'function':
+            import tensorflow as tf
+
+            @tf.function(input_signature=[tf.TensorSpec(shape=[None, N_FEATURES], dtype=tf.float32)])
+            def serve(x):
+                return model(x, training=False)
+
+            fast_path = lambda X: serve(tf.constant(X, dtype=tf.float32)).numpy()
+        elif self.inference_mode == 'numpy':
+            try:
+                fast_path = DenseNetwork.from_keras_model(model).predict
+            except ValueError as e:
+                logging.warning("NumPy inference not available for this model, using model.predict: %s", e)
+        if fast_path is not None and not self._matches_model_predict(fast_path):
+            return None
+        return fast_path
+
+    def _matches_model_predict(self, fast_path):
+        # the fast path must give the same probabilities as model.predict, otherwise we fall back to it
+        rng = np.random.default_rng(0)
+        X = rng.uniform(0, 200, size=(64, N_FEATURES)).astype(np.float32)
+        expected = self.model.predict(X, verbose=0)
+        actual = fast_path(X)
+        if not np.allclose(actual, expected, rtol=1e-4, atol=1e-5):
+            logging.error("%s inference differs from model.predict (max abs diff %g), disabling it",
+                          self.inference_mode, float(np.max(np.abs(actual - expected))))
+            return False
+        return True
+
+    def predict(self, X):
+        # probabilities, shape (n_rows, 1), for a (n_rows, 13) feature matrix
+        if self.fast_path is not None and len(X) <= self.fast_path_max_rows:
+            return self.fast_path(X)
+        batch_size = int(os.getenv('PREDICT_BATCH_SIZE', 1024))
+        return self.model.predict(X, batch_size=batch_size, verbose=0)
+
+    def warm_up(self):
+        # Run synthetic batches through the model so TensorFlow traces the predict function and allocates
+        # its buffers before the first real request arrives
+        batch_size = int(os.getenv('WARMUP_BATCH_SIZE', 32))
+        X = np.zeros((batch_size, N_FEATURES), dtype=np.float32)
+        self.predict(X[:1])
+        self.predict(X)
+
+
+class DenseModel:
+    """A Dense MLP run by DenseNetwork for inputs of every size, without TensorFlow.
+
+    The weights come from the model_weights.npz exported by training-api (with the layer activations from the
+    manifest) or straight out of a .keras archive.
+    """
+
+    def __init__(self, file_path, network):
+        self.file_path = file_path
+        self.version = model_version(file_path)
+        self.network = network
+
+    @classmethod
+    def from_npz(cls, file_path, layers):
+        # arrays kernel_<i> and bias_<i> of the i-th layer of the manifest
+        with np.load(file_path) as weights:
+            return cls(file_path, DenseNetwork([(weights[f'kernel_{i}'], weights[f'bias_{i}'], layer['activation'])
+                                                for i, layer in enumerate(layers)]))
+
+    @classmethod
+    def from_keras_archive(cls, file_path):
+        return cls(file_path, DenseNetwork.from_keras_archive(file_path))
+
+    def predict(self, X):
+        return self.network.predict(X)
+
+    def warm_up(self):
+        batch_size = int(os.getenv('WARMUP_BATCH_SIZE', 32))
+        self.predict(np.zeros((batch_size, N_FEATURES), dtype=np.float32))
+
+
+class XGBoostModel:
+    """An XGBoost model served through the booster's inplace_predict.
+
+    The model is either the native model.ubj written by training-api (?models=xgboost), loaded straight into a
+    Booster, or the pickled XGBClassifier. inplace_predict scores the request matrix directly, without
+    building a DMatrix or going through the scikit-learn wrapper.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.version = model_version(file_path)
+        if file_path.endswith('.ubj'):
+            import xgboost as xgb
+            self.booster = xgb.Booster(model_file=file_path)
+        else:
+            with open(file_path, 'rb') as f:
+                classifier = pickle.load(f)
+            self.booster = classifier.get_booster()
+        # under gunicorn, stay within the cores given to this worker (see gunicorn.conf.py)
+        n_threads = int(os.getenv('OMP_NUM_THREADS', 0))
+        if n_threads > 0:
+            self.booster.set_param({'nthread': n_threads})
+
+    def predict(self, X):
+        # binary:logistic gives the probability of the positive class, shape (n_rows,)
+        return self.booster.inplace_predict(X).reshape(-1, 1)
+
+    def warm_up(self):
+        batch_size = int(os.getenv('WARMUP_BATCH_SIZE', 32))
+        self.predict(np.zeros((batch_size, N_FEATURES), dtype=np.float32))
+
+
+class ScaledModel:
+    """Standardises the features with the scaler of the manifest before calling the model.
+
+    The whole request matrix is standardised in one vectorised pass. It is computed exactly as
+    StandardScaler.transform does, (X - mean) / scale in float64, before the cast to float32: tree split
+    thresholds sit on the standardised training values, and a float32 shortcut such as multiplying by 1 / scale
+    moves some inputs by one ulp to the other side of a split.
+    """
+
+    def __init__(self, model, mean, scale):
+        self.model = model
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+
+    def predict(self, X):
+        Z = np.subtract(X, self.mean, dtype=np.float64)
+        Z /= self.scale
+        return self.model.predict(Z.astype(np.float32))
+
+    def warm_up(self):
+        self.model.warm_up()
+
+
+def load_manifest(file_path, inference_mode='numpy', fast_path_max_rows=256):
+    # model_manifest.json: the serving artifact next to it, its format and the feature order it expects
+    with open(file_path) as f:
+        manifest = json.load(f)
+    if manifest.get('features', FEATURE_NAMES) != FEATURE_NAMES:
+        raise ValueError(f"{file_path} expects the features {manifest['features']}, requests give {FEATURE_NAMES}")
+    artifact = os.path.join(os.path.dirname(file_path), manifest['artifact'])
+    if manifest['format'] == 'dense-npz':
+        model = DenseModel.from_npz(artifact, manifest['layers'])
+    elif manifest['format'] == 'xgboost-ubj':
+        model = XGBoostModel(artifact)
+    else:
+        raise ValueError(f"Unknown model format {manifest['format']} in {file_path}")
+    scaler = manifest.get('scaler')
+    if scaler and isinstance(model, DenseModel):
+        # the MLP takes the scaler into its first layer, other models standardise the batch before predicting
+        model.network.fold_standardization(scaler['mean'], scaler['scale'])
+    elif scaler:
+        model = ScaledModel(model, scaler['mean'], scaler['scale'])
+    # the manifest is written after the artifact, its version identifies the pair
+    model.file_path = file_path
+    model.version = model_version(file_path)
+    model.manifest = manifest
+    return model
+
+
+def load_model_file(file_path, inference_mode='numpy', fast_path_max_rows=256, runtime='numpy'):
+    kind = artifact_type(file_path)
+    logging.info("Loading %s model from %s", kind, file_path)
+    if kind == 'manifest':
+        return load_manifest(file_path, inference_mode, fast_path_max_rows)
+    if kind == 'xgboost':
+        return XGBoostModel(file_path)
+    if runtime == 'numpy':
+        try:
+            return DenseModel.from_keras_archive(file_path)
+        except (ValueError, KeyError) as e:
+            logging.warning("Cannot run %s with NumPy, falling back to Keras: %s", file_path, e)
+    return KerasModel(file_path, inference_mode, fast_path_max_rows)
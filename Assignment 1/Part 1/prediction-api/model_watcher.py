@@ -0,0 +1,72 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from model_backends import MODEL_FILE_NAMES, model_version
+
+
+class ModelWatcher:
+    """Polls MODEL_REPO for a new model and hot-swaps it into the predictor.
+
+    The model file is resolved again on every poll, so a manifest that appears next to a model.keras is
+    picked up. A change is detected from the resolved path and the modification time and size of every
+    model file in MODEL_REPO, of the artifact the manifest points at, and of an optional version file (e.g.
+    the production_metrics.json written by the training pipeline after a promotion). The new file
+    is only loaded once it has stayed unchanged for one poll interval, so a model that is still being copied
+    is never picked up. If loading fails the current model keeps serving.
+    """
+
+    def __init__(self, predictor, interval_seconds=30, version_file=None):
+        self.predictor = predictor
+        self.interval = interval_seconds
+        self.model_dir = os.path.dirname(predictor.model_path())
+        # a relative version file is looked up next to the model
+        self.version_file = os.path.join(self.model_dir, version_file) if version_file else None
+
+    def _current_version(self):
+        # (resolved model file, its version, the versions of the other files the served model depends on)
+        model_file = self.predictor.model_path()
+        versions = [model_file, model_version(model_file)]
+        versions += [model_version(os.path.join(self.model_dir, name)) for name in MODEL_FILE_NAMES]
+        if model_file.endswith('.json'):
+            artifact = _manifest_artifact(model_file)
+            versions.append(model_version(artifact) if artifact else None)
+        if self.version_file:
+            versions.append(model_version(self.version_file))
+        return tuple(versions)
+
+    def start(self):
+        threading.Thread(target=self._run, name='model-watcher', daemon=True).start()
+        logging.info("Watching %s for new models every %s s", self.model_dir, self.interval)
+
+    def _run(self):
+        served = self._current_version()
+        pending = None
+        while True:
+            time.sleep(self.interval)
+            version = self._current_version()
+            if version == served or version[1] is None:
+                pending = None
+                continue
+            if version != pending:
+                # changed since the last poll, wait until the copy has finished
+                pending = version
+                continue
+            try:
+                self.predictor.reload()
+            except Exception:
+                logging.exception("Loading the new model failed, keeping the current one")
+            # either way, don't retry the same file on every poll
+            served = version
+            pending = None
+
+
+def _manifest_artifact(manifest_file):
+    # the artifact next to the manifest, None while the manifest is missing or being written
+    try:
+        with open(manifest_file) as f:
+            return os.path.join(os.path.dirname(manifest_file), json.load(f)['artifact'])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
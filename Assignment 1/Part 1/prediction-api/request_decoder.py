@@ -0,0 +1,69 @@
+import math
+
+import numpy as np
+
+# Column order the model was trained on (Heart_disease_cleveland_new.csv without the target), with the JSON type
+# each feature must have. oldpeak is the only continuous feature, the others are integer codes.
+FEATURES = [
+    ("age", int),
+    ("sex", int),
+    ("cp", int),
+    ("trestbps", int),
+    ("chol", int),
+    ("fbs", int),
+    ("restecg", int),
+    ("thalach", int),
+    ("exang", int),
+    ("oldpeak", float),
+    ("slope", int),
+    ("ca", int),
+    ("thal", int),
+]
+FEATURE_NAMES = [name for name, _ in FEATURES]
+N_FEATURES = len(FEATURES)
+
+
+class InvalidRecordError(ValueError):
+    pass
+
+
+def _check_value(index, name, kind, value):
+    # bool is a subclass of int, but true/false is never a valid feature value
+    if isinstance(value, bool):
+        raise InvalidRecordError(f"record {index}: '{name}' must be a number, got {value!r}")
+    if kind is int:
+        # JSON clients that serialise every number as a float send 63.0, which is still an integer code
+        if not (isinstance(value, int) or isinstance(value, float) and value.is_integer()):
+            raise InvalidRecordError(f"record {index}: '{name}' must be an integer, got {value!r}")
+    elif not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise InvalidRecordError(f"record {index}: '{name}' must be a finite number, got {value!r}")
+
+
+def decode_records(records, out=None):
+    """Validate parsed JSON records and write them into a float64 (n_records, 13) matrix.
+
+    Values are placed by feature name, so the column order never depends on the key order of the request.
+    float64 keeps the JSON numbers exact (float32 turns oldpeak 2.3 into 2.2999999523), which matters when the
+    model standardises them before tree splits; models that run in float32 cast the matrix themselves.
+    A single record may be passed as a dict. `out` can be a preallocated buffer of at least n_records rows.
+    """
+    if isinstance(records, dict):
+        records = [records]
+    if not isinstance(records, list) or len(records) == 0:
+        raise InvalidRecordError("expected a JSON object or a non-empty JSON list of objects")
+    if out is None:
+        out = np.empty((len(records), N_FEATURES), dtype=np.float64)
+    elif out.shape[0] < len(records) or out.shape[1] != N_FEATURES:
+        raise ValueError(f"buffer of shape {out.shape} is too small for {len(records)} records")
+
+    for i, record in enumerate(records):
+        if not isinstance(record, dict):
+            raise InvalidRecordError(f"record {i}: expected a JSON object, got {type(record).__name__}")
+        try:
+            row = [record[name] for name in FEATURE_NAMES]
+        except KeyError as e:
+            raise InvalidRecordError(f"record {i}: missing feature {e}") from None
+        for (name, kind), value in zip(FEATURES, row):
+            _check_value(i, name, kind, value)
+        out[i] = row
+    return out[:len(records)]
@@ -1,12 +1,16 @@
 # importing Flask and other modules
-import json
 import os
 import logging
+
 import requests
 from flask import Flask, request, render_template, jsonify
 
+from predictor_client import PredictorClient
+
 # Flask constructor
 app = Flask(__name__)
+# one pooled keep-alive client per process, shared by all requests (see predictor_client.py)
+predictor_client = PredictorClient.from_env()
 
 
 # A decorator used to tell the application
@@ -40,10 +44,8 @@ def check_heart():
 
         app.logger.debug("Prediction input : %s", prediction_input)
 
-        # use requests library to execute the prediction service API by sending an HTTP POST request
+        # use the pooled predictor client to execute the prediction service API by sending an HTTP POST request
         # use an environment variable to find the value of the heart disease prediction API
-        # json.dumps() function will convert a subset of Python objects into a json string.
-        # json.loads() method can be used to parse a valid JSON string and convert it into a Python Dictionary.
         predictor_api_url = os.environ.get('PREDICTOR_API', 'NOT_SET')
         app.logger.info("Calling API: %s", predictor_api_url)
         if not predictor_api_url or predictor_api_url == 'NOT_SET':
@@ -51,7 +53,7 @@ def check_heart():
             return jsonify(message="Prediction service is not configured (PREDICTOR_API missing)."), 500
         
         try:
-            res = requests.post(predictor_api_url, json=json.loads(json.dumps(prediction_input)), timeout=30)
+            res = predictor_client.predict(predictor_api_url, prediction_input)
             app.logger.info("API Response Status: %s", res.status_code)
             app.logger.info("API Response Text: %s", res.text)
             
@@ -79,6 +81,38 @@ def check_heart():
     # '/checkheart' path
 
 
+@app.route('/checkheart/batch', methods=["POST"])
+def check_heart_batch():
+    # JSON list of patients, split into chunks that are sent to the predictor's batch endpoint concurrently
+    prediction_input = request.get_json(silent=True)
+    if not isinstance(prediction_input, list) or len(prediction_input) == 0:
+        return jsonify(message="Expected a non-empty JSON list of patients."), 400
+    predictor_api_url = os.environ.get('PREDICTOR_API', 'NOT_SET')
+    if not predictor_api_url or predictor_api_url == 'NOT_SET':
+        app.logger.error("PREDICTOR_API environment variable is not set")
+        return jsonify(message="Prediction service is not configured (PREDICTOR_API missing)."), 500
+    # .../heart_predictor or .../heart_predictor/ -> .../heart_predictor/batch
+    batch_api_url = os.environ.get('PREDICTOR_BATCH_API', predictor_api_url.rstrip('/') + '/batch')
+
+    chunk_size = int(os.environ.get('PREDICTOR_BATCH_CHUNK', 500))
+    futures = [predictor_client.predict_async(batch_api_url, prediction_input[i:i + chunk_size])
+               for i in range(0, len(prediction_input), chunk_size)]
+    results = []
+    try:
+        for future in futures:
+            res = future.result()
+            if res.status_code != 200:
+                return jsonify(message=f"API Error: Status {res.status_code}, Response: {res.text}"), res.status_code
+            results.extend(res.json()['results'])
+    except requests.exceptions.RequestException as e:
+        app.logger.error("Request failed: %s", str(e))
+        return jsonify(message=f"Failed to call prediction API: {str(e)}"), 500
+    except (KeyError, ValueError) as e:
+        app.logger.error("Invalid response: %s", str(e))
+        return jsonify(message=f"Invalid response from API: {str(e)}"), 500
+    return jsonify(results=results), 200
+
+
 # The code within this conditional block will only run the python file is executed as a
 # script. See https://realpython.com/if-name-main-python/
 if __name__ == '__main__':
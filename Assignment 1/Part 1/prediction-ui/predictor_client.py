@@ -0,0 +1,42 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class PredictorClient:
+    """HTTP client for prediction-api that keeps connections (and their TLS sessions) open between calls.
+
+    All calls share one requests.Session whose connection pool holds up to pool_size keep-alive connections.
+    Failed connections and 502/503/504 replies (e.g. a Cloud Run instance that is starting) are retried with
+    exponential backoff; predictions have no side effects, so retrying a POST is safe. predict_async runs the
+    call on a thread pool of the same size, so one UI worker can have pool_size calls in flight.
+    """
+
+    def __init__(self, pool_size=10, connect_timeout=3.05, read_timeout=30, retries=3, backoff_factor=0.3):
+        self.timeout = (connect_timeout, read_timeout)
+        retry = Retry(total=retries, connect=retries, read=retries, status=retries,
+                      backoff_factor=backoff_factor, status_forcelist=(502, 503, 504),
+                      allowed_methods=frozenset(['POST']), raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='predictor-client')
+
+    @classmethod
+    def from_env(cls):
+        return cls(pool_size=int(os.environ.get('PREDICTOR_POOL_SIZE', 10)),
+                   connect_timeout=float(os.environ.get('PREDICTOR_CONNECT_TIMEOUT', 3.05)),
+                   read_timeout=float(os.environ.get('PREDICTOR_READ_TIMEOUT', 30)),
+                   retries=int(os.environ.get('PREDICTOR_RETRIES', 3)),
+                   backoff_factor=float(os.environ.get('PREDICTOR_BACKOFF_FACTOR', 0.3)))
+
+    def predict(self, url, prediction_input):
+        return self.session.post(url, json=prediction_input, timeout=self.timeout)
+
+    def predict_async(self, url, prediction_input):
+        # returns a concurrent.futures.Future of the response
+        return self._executor.submit(self.predict, url, prediction_input)
@@ -1,2 +0,0 @@
-# This file makes resources a Python package
-
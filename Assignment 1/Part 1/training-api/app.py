@@ -1,22 +1,70 @@
-import json
 import os
 
-import pandas as pd
-from flask import Flask, request
+from flask import Flask, request, jsonify, url_for
 
-from resources import model_trainer
+from resources import data_loader, registry
+from resources.profiler import TrainingProfiler
+from resources.training_jobs import TooManyJobsError, TrainingJobs
 
 app = Flask(__name__)
 app.config["DEBUG"] = True
 
+# training runs in background processes, TRAINING_MAX_CONCURRENT_JOBS at a time, with at most
+# TRAINING_MAX_PENDING_JOBS running or queued, and the status of the last TRAINING_MAX_FINISHED_JOBS finished
+# jobs kept. A job trains every model of its request on the same data
+jobs = TrainingJobs(registry.train_models,
+                    max_workers=int(os.environ.get("TRAINING_MAX_CONCURRENT_JOBS", 1)),
+                    max_pending=int(os.environ.get("TRAINING_MAX_PENDING_JOBS", 4)),
+                    max_finished=int(os.environ.get("TRAINING_MAX_FINISHED_JOBS", 100)))
+
 
 @app.route('/training-api/model', methods=['POST'])
 def train_models():
-    # the training input data in the message body as a JSON payload
-    training_input = request.get_json()
-    df = pd.read_json(json.dumps(training_input), orient='records')
-    resp = model_trainer.train(df.values)
-    return resp
+    # ?models=mlp,xgboost trains several models on the data parsed once, the first of them is served
+    try:
+        options = registry.training_options(request.args)
+    except ValueError as e:
+        return jsonify({'message': f'Invalid training options: {e}'}), 400
+    # ?profile=true adds the time of every phase, peak RSS and rows/sec to the metrics
+    options['profiler'] = TrainingProfiler(enabled=request.args.get('profile', 'false').lower() == 'true')
+    # the training data in the message body (JSON records, NDJSON, CSV or Parquet), or {"path": ...} of a file
+    try:
+        with options['profiler'].phase('load'):
+            dataset = data_loader.load_request(request)
+    except data_loader.InvalidDatasetError as e:
+        return jsonify({'message': f'Invalid training data: {e}'}), 400
+    # ?sync=true trains inside the request and returns the metrics, as before
+    if request.args.get('sync', 'false').lower() == 'true':
+        return jsonify(registry.train_models(dataset, **options)), 200
+    try:
+        job_id = jobs.submit(dataset, **options)
+    except TooManyJobsError as e:
+        return jsonify({'message': str(e)}), 429
+    return jsonify({'job_id': job_id, 'status': 'queued',
+                    'status_url': url_for('training_job_status', job_id=job_id)}), 202
+
+
+@app.route('/training-api/jobs', methods=['GET'])
+def training_jobs():
+    return jsonify(jobs.list()), 200
+
+
+@app.route('/training-api/jobs/<job_id>', methods=['GET'])
+def training_job_status(job_id):
+    status = jobs.status(job_id)
+    if status is None:
+        return jsonify({'message': f'Unknown job {job_id}'}), 404
+    return jsonify(status), 200
+
+
+@app.route('/training-api/jobs/<job_id>/metrics', methods=['GET'])
+def training_job_metrics(job_id):
+    status = jobs.status(job_id)
+    if status is None:
+        return jsonify({'message': f'Unknown job {job_id}'}), 404
+    if status['status'] != 'succeeded':
+        return jsonify({'message': f"Job {job_id} is {status['status']}"}), 409
+    return jsonify(status['metrics']), 200
 
 
 # The code within this conditional block will only run the python file is executed as a
@@ -0,0 +1,51 @@
+# Benchmark of the training-api service: replays the Cleveland CSV repeated 10x to 1000x
+# through POST /training-api/model?sync=true&profile=true and prints the profile of every run
+# Usage: python benchmark_training.py [--url http://localhost:5000] [--query epochs=20] [scale ...]
+import argparse
+import json
+import os
+import time
+import urllib.request
+
+DATA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Data',
+                         'Heart_disease_cleveland_new.csv')
+
+
+def scaled_csv(scale):
+    # the header once and the data rows scale times, as one CSV body
+    with open(DATA_FILE, encoding='utf-8-sig') as f:
+        header, *rows = f.read().splitlines()
+    body = '\n'.join([header] + [row for row in rows if row] * scale) + '\n'
+    return body.encode('utf-8'), len(rows) * scale
+
+
+def train(url, body, query):
+    request = urllib.request.Request(f"{url}/training-api/model?sync=true&profile=true{query}", data=body,
+                                     headers={'Content-Type': 'text/csv'}, method='POST')
+    started = time.perf_counter()
+    with urllib.request.urlopen(request) as response:
+        metrics = json.load(response)
+    return metrics, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--query', action='append', default=[], help='extra query parameter, e.g. epochs=20')
+    parser.add_argument('scales', nargs='*', type=int, default=[10, 100, 1000])
+    args = parser.parse_args()
+    query = ''.join(f'&{parameter}' for parameter in args.query)
+    print(f"{'scale':>6} {'rows':>8} {'MB':>7} {'request s':>10} {'peak RSS MB':>12} {'rows/s':>12}  phases (s)")
+    for scale in args.scales:
+        body, n_rows = scaled_csv(scale)
+        metrics, seconds = train(args.url, body, query)
+        profile = metrics['profile']
+        # rows/sec of the epochs of the MLP or the boosting rounds of XGBoost
+        throughput = next(iter(profile['throughput'].values()), {}).get('mean_rows_per_second')
+        phases = ' '.join(f"{name}={value:.2f}" for name, value in profile['phases_seconds'].items())
+        print(f"{scale:>6} {n_rows:>8} {len(body) / 1e6:>7.1f} {seconds:>10.2f} {profile['peak_rss_mb']:>12.0f} "
+              f"{throughput or 0:>12.0f}  {phases}")
+
+
+if __name__ == '__main__':
+    main()
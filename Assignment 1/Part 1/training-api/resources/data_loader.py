@@ -0,0 +1,191 @@
+# Reads the training data into one float32 matrix a chunk at a time, from the request body or from a file
+# referenced by path, so a large dataset is never held as JSON text, Python objects and a DataFrame at once
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+# Columns of the Heart Disease Cleveland dataset, in the order the trainers expect them: 13 features and the target
+COLUMNS = ['age', 'sex', 'cp', 'trestbps', 'chol', 'fbs', 'restecg', 'thalach', 'exang', 'oldpeak', 'slope',
+           'ca', 'thal', 'target']
+
+CONTENT_TYPES = {
+    'application/json': 'json',
+    'application/x-ndjson': 'ndjson',
+    'application/ndjson': 'ndjson',
+    'application/jsonl': 'ndjson',
+    'text/csv': 'csv',
+    'application/vnd.apache.parquet': 'parquet',
+    'application/x-parquet': 'parquet',
+    'application/parquet': 'parquet',
+}
+
+EXTENSIONS = {
+    '.json': 'json',
+    '.ndjson': 'ndjson',
+    '.jsonl': 'ndjson',
+    '.csv': 'csv',
+    '.parquet': 'parquet',
+}
+
+# a CSV row of the Cleveland data takes 34 to 37 bytes (36 on average), used to size the array from the body
+# size. The shortest row is used, so the array is never too small for such data and never has to grow
+_BYTES_PER_ROW = 34
+
+
+class InvalidDatasetError(ValueError):
+    pass
+
+
+class _RowBuffer:
+    """Preallocated float32 (rows, 14) array that chunks are copied into, doubled when it fills up."""
+
+    def __init__(self, expected_rows=0):
+        self._data = np.empty((max(int(expected_rows), 1024), len(COLUMNS)), dtype=np.float32)
+        self._n_rows = 0
+
+    def reserve(self, n_rows):
+        if n_rows > len(self._data):
+            grown = np.empty((n_rows, len(COLUMNS)), dtype=np.float32)
+            grown[:self._n_rows] = self._data[:self._n_rows]
+            self._data = grown
+
+    def append(self, block):
+        end = self._n_rows + len(block)
+        if end > len(self._data):
+            self.reserve(max(end, 2 * len(self._data)))
+        self._data[self._n_rows:end] = block
+        self._n_rows = end
+
+    def result(self):
+        if self._n_rows == 0:
+            raise InvalidDatasetError("the dataset has no rows")
+        return self._data[:self._n_rows]
+
+
+def _chunk_rows():
+    return int(os.getenv('TRAINING_CHUNK_ROWS', 65536))
+
+
+def _read_csv(source, buffer):
+    for chunk in pd.read_csv(source, chunksize=_chunk_rows(), usecols=COLUMNS, dtype=np.float32,
+                             encoding='utf-8-sig'):
+        buffer.append(chunk[COLUMNS].to_numpy(np.float32))
+
+
+def _read_ndjson(source, buffer):
+    for chunk in pd.read_json(source, lines=True, chunksize=_chunk_rows(), dtype=False):
+        buffer.append(chunk[COLUMNS].to_numpy(np.float32))
+
+
+def _read_parquet(source, buffer):
+    # pyarrow is only needed for Parquet input
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(source)
+    buffer.reserve(parquet_file.metadata.num_rows)
+    for batch in parquet_file.iter_batches(batch_size=_chunk_rows(), columns=COLUMNS):
+        buffer.append(np.column_stack([batch.column(name).to_numpy(zero_copy_only=False) for name in COLUMNS]))
+
+
+def _read_records(records, buffer):
+    # a JSON array of {column: value} objects, the original request format
+    if not isinstance(records, list):
+        raise InvalidDatasetError("expected a JSON array of records or an object with a 'path'")
+    block = np.empty((len(records), len(COLUMNS)), dtype=np.float32)
+    for i, record in enumerate(records):
+        block[i] = [record[name] for name in COLUMNS]
+    buffer.append(block)
+
+
+_READERS = {'json': _read_records, 'csv': _read_csv, 'ndjson': _read_ndjson, 'parquet': _read_parquet}
+
+
+def _read(data_format, source, expected_rows=0):
+    buffer = _RowBuffer(expected_rows)
+    try:
+        _READERS[data_format](source, buffer)
+    except InvalidDatasetError:
+        raise
+    except KeyError as e:
+        raise InvalidDatasetError(f"missing column {e}") from e
+    except (ValueError, TypeError, OSError) as e:
+        raise InvalidDatasetError(str(e)) from e
+    return buffer.result()
+
+
+def _format_of_path(path):
+    for extension, data_format in EXTENSIONS.items():
+        if path.lower().endswith(extension):
+            return data_format
+    raise InvalidDatasetError(f"cannot tell the format of {path}, expected one of {', '.join(EXTENSIONS)}")
+
+
+def _open_gcs(path):
+    # google-cloud-storage is only needed for gs:// paths
+    from google.cloud import storage
+
+    bucket_name, _, blob_name = path[len('gs://'):].partition('/')
+    blob = storage.Client().bucket(bucket_name).blob(blob_name)
+    blob.reload()
+    # BlobReader downloads the object in chunks and is seekable, which Parquet needs
+    return blob.open('rb'), blob.size
+
+
+def _check_local_path(path):
+    # local files can only be read from below TRAINING_DATA_ROOT, and not at all if it is not set
+    data_root = os.getenv('TRAINING_DATA_ROOT')
+    if not data_root:
+        raise InvalidDatasetError("local dataset paths are disabled, set TRAINING_DATA_ROOT to enable them")
+    root = os.path.realpath(data_root)
+    real_path = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, real_path]) != root:
+        raise InvalidDatasetError(f"{path} is outside TRAINING_DATA_ROOT")
+    return real_path
+
+
+def load_path(path, data_format=None):
+    # a local file below TRAINING_DATA_ROOT or a gs://bucket/object
+    if not isinstance(path, str) or not path:
+        raise InvalidDatasetError(f"path must be a non-empty string, got {path!r}")
+    data_format = data_format or _format_of_path(path)
+    if data_format not in ('csv', 'ndjson', 'parquet'):
+        raise InvalidDatasetError(f"cannot read {data_format} files, use csv, ndjson or parquet")
+    if path.startswith('gs://'):
+        source, size = _open_gcs(path)
+    else:
+        local_path = _check_local_path(path)
+        try:
+            source, size = open(local_path, 'rb'), os.path.getsize(local_path)
+        except OSError as e:
+            raise InvalidDatasetError(str(e)) from e
+    with source:
+        return _read(data_format, source, size // _BYTES_PER_ROW)
+
+
+def load_request(request):
+    """Returns the training data of a Flask request as a float32 (rows, 14) array.
+
+    The format comes from the Content-Type: a JSON array of records, NDJSON, CSV or Parquet. A JSON object
+    {"path": ..., "format": ...} reads the dataset from a file instead. CSV and NDJSON bodies are parsed
+    straight from the request stream, Parquet bodies are spooled to a temporary file first because the
+    reader needs to seek.
+    """
+    data_format = CONTENT_TYPES.get(request.mimetype)
+    if data_format is None:
+        raise InvalidDatasetError(f"unsupported Content-Type {request.mimetype}, "
+                                  f"expected one of {', '.join(CONTENT_TYPES)}")
+    if data_format == 'json':
+        body = request.get_json(silent=True)
+        if isinstance(body, dict) and 'path' in body:
+            return load_path(body['path'], body.get('format'))
+        return _read('json', body, len(body) if isinstance(body, list) else 0)
+    expected_rows = (request.content_length or 0) // _BYTES_PER_ROW
+    if data_format == 'parquet':
+        with tempfile.SpooledTemporaryFile(max_size=64 * 1024 * 1024) as spool:
+            shutil.copyfileobj(request.stream, spool, 1024 * 1024)
+            spool.seek(0)
+            return _read('parquet', spool)
+    return _read(data_format, request.stream, expected_rows)
@@ -3,17 +3,85 @@
 # see https://machinelearningmastery.com/save-load-keras-deep-learning-models/
 import logging
 import os
+import time
+from datetime import datetime, timezone
 
-from flask import jsonify
+import numpy as np
+import tensorflow as tf
+from keras.callbacks import Callback, EarlyStopping
 from keras.layers import Dense
-from keras.models import Sequential
+from keras.models import Sequential, load_model
 
+from resources.data_loader import COLUMNS
+from resources.profiler import TrainingProfiler
+from resources.registry import MANIFEST_FILE, artifact_file, write_serving_files
 
-def train(dataset):
-    # split into input (X) and output (Y) variables
-    # Heart Disease has 13 features (columns 0-12) and 1 target (column 13)
-    X = dataset[:, 0:13]
-    Y = dataset[:, 13]
+
+class EpochTimer(Callback):
+    # wall time of every epoch, training and validation included
+    def on_train_begin(self, logs=None):
+        self.epoch_seconds = []
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._started = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.epoch_seconds.append(time.perf_counter() - self._started)
+
+
+def make_dataset(X, Y, batch_size, shuffle=False, seed=42):
+    # float32 tensors, cached in memory after the first epoch and batched ahead of the training step
+    dataset = tf.data.Dataset.from_tensor_slices((np.asarray(X, dtype=np.float32),
+                                                  np.asarray(Y, dtype=np.float32))).cache()
+    if shuffle:
+        dataset = dataset.shuffle(min(len(X), 65536), seed=seed, reshuffle_each_iteration=True)
+    return dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
+
+def model_file(manifest_name=MANIFEST_FILE):
+    # model.keras of the served model, named after the manifest for the others (see registry.artifact_file)
+    return os.path.join(os.getenv('MODEL_REPO') or '.', artifact_file(manifest_name, "model.keras"))
+
+
+def load_current_model(manifest_name=MANIFEST_FILE):
+    # the model the last training run saved, None if there is none or it is not a Keras model
+    file_path = model_file(manifest_name)
+    if not os.path.exists(file_path):
+        return None
+    try:
+        return load_model(file_path)
+    except (ValueError, OSError) as e:
+        logging.warning("Cannot warm-start from %s: %s", file_path, e)
+        return None
+
+
+def save_serving_artifacts(model, text_out, model_dir, manifest_name='model_manifest.json'):
+    """Writes the weights as model_weights.npz and a model_manifest.json describing them.
+
+    prediction-api runs the Dense layers with NumPy from these two files, without loading TensorFlow. Another
+    manifest_name gets its own weights (model_manifest_<name>.json -> model_weights_<name>.npz).
+    """
+    weights = {}
+    layers = []
+    for i, layer in enumerate(model.layers):
+        kernel, bias = layer.get_weights()
+        weights[f'kernel_{i}'] = kernel.astype(np.float32)
+        weights[f'bias_{i}'] = bias.astype(np.float32)
+        layers.append({'units': int(kernel.shape[1]), 'activation': layer.get_config()['activation']})
+    manifest = {
+        'format': 'dense-npz',
+        'artifact': artifact_file(manifest_name, 'model_weights.npz'),
+        'features': COLUMNS[:13],
+        'target': COLUMNS[13],
+        'scaler': None,
+        'layers': layers,
+        'metrics': text_out,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+    }
+    write_serving_files(model_dir, manifest_name, manifest, lambda path: np.savez(path, **weights))
+
+
+def build_model():
     # define model
     model = Sequential()
     model.add(Dense(24, input_dim=13, activation='relu'))
@@ -22,22 +90,94 @@ def train(dataset):
     model.add(Dense(1, activation='sigmoid'))
     # compile model
     model.compile(loss='binary_crossentropy', optimizer='adam', metrics=['accuracy'])
-    # Fit the model
-    model.fit(X, Y, epochs=150, batch_size=10, verbose=0)
+    return model
+
+
+def train(dataset, batch_size=None, epochs=None, validation_split=None, patience=None, incremental=False, seed=42,
+          profiler=None, manifest_name='model_manifest.json'):
+    # returns the training metrics as a dict, the caller turns them into the HTTP response
+    # incremental=True continues fitting the saved model on the rows of dataset only, see below
+    # with an enabled profiler the response also gets the time of every phase, peak RSS and rows/sec per epoch
+    profiler = profiler or TrainingProfiler()
+    batch_size = batch_size or int(os.getenv('TRAINING_BATCH_SIZE', 64))
+    if validation_split is None:
+        validation_split = float(os.getenv('TRAINING_VALIDATION_SPLIT', 0.2))
+    patience = patience or int(os.getenv('TRAINING_PATIENCE', 10))
+    with profiler.phase('prepare'):
+        # split into input (X) and output (Y) variables
+        # Heart Disease has 13 features (columns 0-12) and 1 target (column 13)
+        X = dataset[:, 0:13]
+        Y = dataset[:, 13]
+        # hold out a random validation_split of the rows for early stopping
+        order = np.random.default_rng(seed).permutation(len(X))
+        n_validation = int(len(X) * validation_split)
+        train_rows, validation_rows = np.sort(order[n_validation:]), np.sort(order[:n_validation])
+        train_data = make_dataset(X[train_rows], Y[train_rows], batch_size, shuffle=True, seed=seed)
+        validation_data = make_dataset(X[validation_rows], Y[validation_rows], 1024) if n_validation else None
+    # Warm start: continue from the saved weights and optimizer state for a few epochs on the new rows, so the
+    # cost depends on the size of the delta rather than of the whole history. The model is only saved if its
+    # loss on the held-out new rows (all new rows without a validation split) is no worse than before.
+    with profiler.phase('build'):
+        model = load_current_model(manifest_name) if incremental else None
+        warm_start = model is not None
+        if incremental and not warm_start:
+            logging.warning("No Keras model in %s to warm-start from, training from scratch", model_file(manifest_name))
+        if warm_start:
+            epochs = epochs or int(os.getenv('TRAINING_INCREMENTAL_EPOCHS', 20))
+            holdout = validation_data if validation_data is not None else make_dataset(X, Y, 1024)
+            baseline_loss = model.evaluate(holdout, verbose=0)[0]
+        else:
+            epochs = epochs or int(os.getenv('TRAINING_EPOCHS', 150))
+            model = build_model()
+    # Fit the model, stopping once the validation loss has not improved for patience epochs
+    timer = EpochTimer()
+    callbacks = [timer]
+    if validation_data is not None:
+        callbacks.append(EarlyStopping(monitor='val_loss', patience=patience, restore_best_weights=True))
+    with profiler.phase('fit'):
+        history = model.fit(train_data, validation_data=validation_data, epochs=epochs, callbacks=callbacks,
+                            verbose=0)
+    profiler.record_throughput('epoch', len(train_rows), timer.epoch_seconds)
     # evaluate the model
-    scores = model.evaluate(X, Y, verbose=0)
+    with profiler.phase('evaluate'):
+        scores = model.evaluate(make_dataset(X, Y, 1024), verbose=0)
     text_out = {
         "accuracy:": scores[1],
         "loss": scores[0],
+        "batch_size": batch_size,
+        "epochs": len(timer.epoch_seconds),
+        "epoch_seconds": timer.epoch_seconds,
+        "training_seconds": sum(timer.epoch_seconds),
     }
+    if validation_data is not None:
+        best_epoch = int(np.argmin(history.history['val_loss']))
+        text_out.update(best_epoch=best_epoch + 1,
+                        val_loss=history.history['val_loss'][best_epoch],
+                        val_accuracy=history.history['val_accuracy'][best_epoch])
+    if warm_start:
+        with profiler.phase('evaluate'):
+            holdout_loss = model.evaluate(holdout, verbose=0)[0]
+        tolerance = float(os.getenv('INCREMENTAL_TOLERANCE', 0.0))
+        promoted = holdout_loss <= baseline_loss * (1 + tolerance)
+        text_out.update(warm_start=True, baseline_holdout_loss=baseline_loss, holdout_loss=holdout_loss,
+                        promoted=promoted)
+        if not promoted:
+            logging.warning("Warm-started model failed the holdout check (loss %.4f, was %.4f), keeping the "
+                            "current model", holdout_loss, baseline_loss)
+            return profiler.add_to(text_out)
+    elif incremental:
+        text_out.update(warm_start=False, promoted=True)
     logging.info(text_out)
     # Saving model in a given location provided as an env. variable
     model_repo = os.getenv('MODEL_REPO')
     if model_repo:
-        file_path = os.path.join(model_repo, "model.keras")
-        model.save(file_path)
+        with profiler.phase('save'):
+            model.save(model_file(manifest_name))
+            save_serving_artifacts(model, text_out, model_repo, manifest_name)
         logging.info("Saved the model to the location : " + model_repo)
-        return jsonify(text_out), 200
+        return profiler.add_to(text_out)
     else:
-        model.save("model.keras")
-        return jsonify({'message': 'The model was saved locally.'}), 200
+        with profiler.phase('save'):
+            model.save(artifact_file(manifest_name, "model.keras"))
+            save_serving_artifacts(model, text_out, '.', manifest_name)
+        return profiler.add_to({'message': 'The model was saved locally.'})
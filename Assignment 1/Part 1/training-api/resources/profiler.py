@@ -0,0 +1,63 @@
+# Opt-in profiling of one training run (?profile=true): wall time per phase, peak RSS and training throughput
+import resource
+import sys
+import time
+from contextlib import contextmanager
+
+
+def peak_rss_mb():
+    # Peak resident set size of this process. On Linux VmHWM of /proc, which starts afresh in a spawned job
+    # process, while ru_maxrss is carried over from the parent across fork and exec
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class TrainingProfiler:
+    """Collects the phases and throughput of a training run and adds them to the response when enabled.
+
+    The profiler is created by the request handler, which times the loading of the data, and is passed on to
+    the trainer, in the job's own process for background jobs. The peak RSS is measured in the process that
+    trains: for a background job that is the job's fresh worker process, for ?sync=true the Flask process
+    over its whole lifetime.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.phases = {}
+        self.throughput = {}
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - started
+
+    def record_throughput(self, unit, rows, seconds):
+        # rows/sec of every epoch or boosting round, each of which processes `rows` rows
+        rates = [rows / s for s in seconds if s > 0]
+        self.throughput[unit] = {
+            'rows': rows,
+            'count': len(seconds),
+            'rows_per_second': rates,
+            'mean_rows_per_second': sum(rates) / len(rates) if rates else None,
+        }
+
+    def add_to(self, text_out):
+        if self.enabled:
+            text_out['profile'] = {
+                'phases_seconds': self.phases,
+                'total_seconds': sum(self.phases.values()),
+                'peak_rss_mb': peak_rss_mb(),
+                'throughput': self.throughput,
+            }
+        return text_out
@@ -0,0 +1,155 @@
+# Registry of the model types the training service can train behind POST /training-api/model?models=...
+# Every model type names the module of its trainer, imported on first use so that the Flask process and a run
+# that only trains XGBoost never import TensorFlow, and a parser of its query parameters
+import importlib
+import json
+import logging
+import os
+
+from resources.profiler import TrainingProfiler
+
+# the manifest prediction-api serves; the other models of a request write model_manifest_<name>.json
+MANIFEST_FILE = 'model_manifest.json'
+
+SEARCH_STRATEGIES = ('grid', 'random')
+
+
+class UnknownModelError(ValueError):
+    pass
+
+
+def manifest_file(name=None):
+    # model_manifest.json, or model_manifest_<name>.json for the other models of a request
+    return MANIFEST_FILE if name is None else f"model_manifest_{name}.json"
+
+
+def artifact_file(manifest_name, file_name):
+    # the artifact a manifest points at is named after it: model_manifest_xgboost.json -> model_xgboost.ubj,
+    # so a later run that rewrites another manifest's artifacts never changes the model this one describes
+    suffix = os.path.splitext(manifest_name)[0][len('model_manifest'):]
+    stem, extension = os.path.splitext(file_name)
+    return f"{stem}{suffix}{extension}"
+
+
+def write_serving_files(model_dir, manifest_name, manifest, save_artifact):
+    """Writes the serving artifact with save_artifact(path) and the manifest that describes it.
+
+    Both are written to temporary files first and only then moved in place, the artifact right before its
+    manifest, so a reader never sees a half-written file and a manifest never points at an older artifact.
+    """
+    artifact_path = os.path.join(model_dir, manifest['artifact'])
+    manifest_path = os.path.join(model_dir, manifest_name)
+    # keep the extension last, XGBoost picks the format of save_model from it
+    stem, extension = os.path.splitext(artifact_path)
+    artifact_tmp = f"{stem}.tmp{extension}"
+    save_artifact(artifact_tmp)
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(artifact_tmp, artifact_path)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+
+def mlp_options(args):
+    # optional overrides of the TRAINING_* defaults of the trainer
+    options = {}
+    for name, parse in (('batch_size', int), ('epochs', int), ('validation_split', float), ('patience', int)):
+        if name in args:
+            options[name] = parse(args[name])
+    if options.get('batch_size', 1) < 1 or options.get('epochs', 1) < 1 or options.get('patience', 1) < 1:
+        raise ValueError("batch_size, epochs and patience must be positive")
+    if not 0 <= options.get('validation_split', 0) < 1:
+        raise ValueError("validation_split must be at least 0 and below 1")
+    # ?incremental=true continues training the model in MODEL_REPO on the new rows only
+    if args.get('incremental', 'false').lower() == 'true':
+        options['incremental'] = True
+    return options
+
+
+def xgboost_options(args):
+    # ?incremental=true adds rounds (default INCREMENTAL_ROUNDS) to the model in MODEL_REPO, fitted on the new
+    # rows only
+    if args.get('incremental', 'false').lower() == 'true':
+        if 'search' in args:
+            raise ValueError("incremental training cannot be combined with search")
+        rounds = int(args.get('rounds', 0)) or None
+        if rounds is not None and rounds < 1:
+            raise ValueError("rounds must be positive")
+        return {'incremental': True, 'rounds': rounds}
+    # ?search=grid|random turns on the hyperparameter search, tuned by n_iter, folds and space (a JSON object
+    # of parameter name to list of values)
+    search = args.get('search')
+    if search is None:
+        return {}
+    if search not in SEARCH_STRATEGIES:
+        raise ValueError(f"search must be one of {', '.join(SEARCH_STRATEGIES)}")
+    options = {'n_iter': int(args.get('n_iter', 20)), 'n_folds': int(args.get('folds', 5))}
+    if options['n_iter'] < 1 or options['n_folds'] < 2:
+        raise ValueError("n_iter must be at least 1 and folds at least 2")
+    if 'space' in args:
+        space = json.loads(args['space'])
+        if not isinstance(space, dict) or not all(isinstance(v, list) and v for v in space.values()):
+            raise ValueError("space must be a JSON object of parameter name to a non-empty list of values")
+        options['space'] = space
+    return {'search': search, 'search_options': options}
+
+
+# name -> (trainer module, parser of its query parameters). The module has a
+# train(dataset, profiler=..., manifest_name=..., **options) that returns the metrics as a dict
+MODEL_TYPES = {
+    'mlp': ('resources.model_trainer', mlp_options),
+    'xgboost': ('resources.xgboost_trainer', xgboost_options),
+}
+
+
+def register(name, module_name, options=lambda args: {}):
+    # adds a model type, e.g. register('logreg', 'resources.logreg_trainer')
+    MODEL_TYPES[name] = (module_name, options)
+
+
+def trainer(name):
+    if name not in MODEL_TYPES:
+        raise UnknownModelError(f"unknown model {name}, expected one of {', '.join(MODEL_TYPES)}")
+    return importlib.import_module(MODEL_TYPES[name][0])
+
+
+def parse_models(value=None):
+    # comma separated model names, TRAINING_MODELS (default mlp) when not given
+    models = []
+    for name in (value or os.getenv('TRAINING_MODELS', 'mlp')).split(','):
+        name = name.strip()
+        if name not in MODEL_TYPES:
+            raise UnknownModelError(f"unknown model {name}, expected one of {', '.join(MODEL_TYPES)}")
+        if name not in models:
+            models.append(name)
+    return models
+
+
+def training_options(args):
+    # the models to train and the options of each of them, from the query parameters of the request
+    models = parse_models(args.get('models'))
+    return {'models': models, 'options': {name: MODEL_TYPES[name][1](args) for name in models}}
+
+
+def train_models(dataset, models, options=None, profiler=None):
+    """Trains every model in models on the same parsed dataset, one after the other in this process.
+
+    The first model is the one served. It writes model_manifest.json, its serving artifact (model_weights.npz
+    for mlp, model.ubj for xgboost) and its full model (model.keras or model.pkl), which incremental training
+    warm-starts from. Every other model writes model_manifest_<name>.json and the same files named after it:
+    model_weights_<name>.npz or model_<name>.ubj, and model_<name>.keras or model_<name>.pkl. prediction-api
+    can be pointed at one of those manifests with MODEL_FILE. With one model the response is that model's metrics, as before; with several it is
+    {"models": {name: metrics}, "serving_model": name}, for comparing them.
+    """
+    options = options or {}
+    profiler = profiler or TrainingProfiler()
+    if len(models) == 1:
+        return trainer(models[0]).train(dataset, profiler=profiler, **options.get(models[0], {}))
+    results = {}
+    for name in models:
+        manifest_name = manifest_file(None if name == models[0] else name)
+        # every model gets a profile of its own, the profile of the request has the loading of the data
+        model_profiler = TrainingProfiler(enabled=profiler.enabled)
+        results[name] = trainer(name).train(dataset, profiler=model_profiler, manifest_name=manifest_name,
+                                            **options.get(name, {}))
+        logging.info("Trained %s", name)
+    return profiler.add_to({'models': results, 'serving_model': models[0]})
@@ -0,0 +1,148 @@
+# Background training jobs: the HTTP handler queues the job and returns a job ID straight away,
+# the training itself runs in a separate process
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+
+class TooManyJobsError(Exception):
+    pass
+
+
+class TrainingJobs:
+    """Runs train_fn(dataset, **options) in a process pool and keeps the status and result of every job.
+
+    Each job runs in a freshly spawned process (max_tasks_per_child=1): the Flask process never holds the
+    GIL or the TensorFlow/XGBoost state of a training run, and the memory of a finished job is returned to
+    the OS. At most max_workers jobs train at once and at most max_pending jobs (running + queued) are
+    accepted, so a burst of requests cannot exhaust the container's memory. A worker that dies (e.g. OOM
+    killed) breaks the pool: its jobs fail and the next submit starts a new pool.
+
+    The dataset is not pickled through the pool's pipe: it is written to a .npy file in TRAINING_DATA_DIR
+    that the job memory-maps, and the file is deleted when the job is done. The status of the last
+    max_finished finished jobs is kept, older ones are forgotten.
+    """
+
+    def __init__(self, train_fn, max_workers=1, max_pending=4, max_finished=100):
+        self.train_fn = train_fn
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.max_finished = max_finished
+        self._executor = None
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # created on first use, the spawned children import app.py again and must not start a pool of their own
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                 mp_context=multiprocessing.get_context('spawn'),
+                                                 max_tasks_per_child=1)
+        return self._executor
+
+    def _check_pending(self):
+        pending = sum(1 for job in self._jobs.values() if not job['future'].done())
+        if pending >= self.max_pending:
+            raise TooManyJobsError(f"{pending} training jobs are already queued or running")
+
+    def _forget_finished(self):
+        # the oldest finished jobs first, _jobs is in submission order
+        finished = [job_id for job_id, job in self._jobs.items() if job['future'].done()]
+        for job_id in finished[:max(len(finished) - self.max_finished, 0)]:
+            del self._jobs[job_id]
+
+    def submit(self, dataset, **options):
+        # checked before the dataset is written to disk and again after, the lock is not held while writing so
+        # that status requests are not blocked by a large upload
+        with self._lock:
+            self._check_pending()
+        job_id = uuid.uuid4().hex
+        dataset_file = _spill(job_id, dataset)
+        try:
+            with self._lock:
+                self._check_pending()
+                future = self._submit(_timed_call, self.train_fn, dataset_file, options)
+                self._jobs[job_id] = {'future': future, 'submitted_at': time.time()}
+                self._forget_finished()
+        except BaseException:
+            _remove(dataset_file)
+            raise
+        future.add_done_callback(lambda f: _job_done(job_id, dataset_file, f))
+        logging.info("Queued training job %s", job_id)
+        return job_id
+
+    def _submit(self, *args):
+        try:
+            return self._get_executor().submit(*args)
+        except BrokenProcessPool as e:
+            # the jobs of the broken pool have already failed with it, this one gets a new pool
+            logging.warning("Training process pool is broken (%s), starting a new one", e)
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        try:
+            return self._get_executor().submit(*args)
+        except BrokenProcessPool as e:
+            # the job is recorded as failed rather than failing the request
+            future = Future()
+            future.set_exception(e)
+            return future
+
+    def status(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        future = job['future']
+        status = {'job_id': job_id, 'submitted_at': job['submitted_at']}
+        if not future.done():
+            status['status'] = 'running' if future.running() else 'queued'
+        elif future.exception() is not None:
+            status['status'] = 'failed'
+            status['error'] = repr(future.exception())
+        else:
+            result, started_at, finished_at = future.result()
+            status.update(status='succeeded', started_at=started_at, finished_at=finished_at,
+                          duration_seconds=finished_at - started_at, metrics=result)
+        return status
+
+    def list(self):
+        with self._lock:
+            job_ids = list(self._jobs)
+        return [self.status(job_id) for job_id in job_ids]
+
+
+def _spill(job_id, dataset):
+    data_dir = os.getenv('TRAINING_DATA_DIR', tempfile.gettempdir())
+    dataset_file = os.path.join(data_dir, f"training-job-{job_id}.npy")
+    np.save(dataset_file, dataset)
+    return dataset_file
+
+
+def _timed_call(train_fn, dataset_file, options):
+    # runs in the child process
+    started_at = time.time()
+    result = train_fn(np.load(dataset_file, mmap_mode='r'), **options)
+    return result, started_at, time.time()
+
+
+def _remove(dataset_file):
+    try:
+        os.remove(dataset_file)
+    except OSError:
+        pass
+
+
+def _job_done(job_id, dataset_file, future):
+    _remove(dataset_file)
+    if future.exception() is not None:
+        logging.error("Training job %s failed: %r", job_id, future.exception())
+    else:
+        logging.info("Training job %s finished", job_id)
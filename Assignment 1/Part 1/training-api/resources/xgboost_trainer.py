@@ -0,0 +1,312 @@
+# XGBoost for Heart Disease Cleveland Dataset
+# Alternative implementation to Neural Network approach
+import logging
+import os
+import pickle
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import xgboost as xgb
+from xgboost import XGBClassifier
+import numpy as np
+
+from resources.data_loader import COLUMNS
+from resources.profiler import TrainingProfiler
+from resources.registry import MANIFEST_FILE, SEARCH_STRATEGIES, artifact_file, write_serving_files
+
+# Hyperparameter values tried by the search mode, overridable per request
+DEFAULT_SEARCH_SPACE = {
+    'max_depth': [3, 4, 5, 6],
+    'learning_rate': [0.03, 0.1, 0.3],
+    'min_child_weight': [1, 3, 5],
+    'subsample': [0.8, 1.0],
+    'colsample_bytree': [0.8, 1.0],
+}
+
+
+class RoundTimer(xgb.callback.TrainingCallback):
+    # wall time of every boosting round, for the rows/sec of the profile
+    def __init__(self):
+        super().__init__()
+        self.round_seconds = []
+        self._started = None
+
+    def before_iteration(self, model, epoch, evals_log):
+        self._started = time.perf_counter()
+        return False
+
+    def after_iteration(self, model, epoch, evals_log):
+        self.round_seconds.append(time.perf_counter() - self._started)
+        return False
+
+
+def fit_timed(model, X, Y, profiler, **fit_args):
+    # fits the model in the profiler's fit phase; the round timer is removed again so the model pickles without it
+    timer = RoundTimer()
+    model.set_params(callbacks=[timer])
+    with profiler.phase('fit'):
+        model.fit(X, Y, **fit_args)
+    model.set_params(callbacks=None)
+    profiler.record_throughput('boosting_round', len(X), timer.round_seconds)
+
+
+def train(dataset, search=None, search_options=None, incremental=False, rounds=None, profiler=None,
+          manifest_name='model_manifest.json'):
+    # returns the training metrics as a dict, the caller turns them into the HTTP response
+    # with an enabled profiler the response also gets the time of every phase, peak RSS and rows/sec per round
+    profiler = profiler or TrainingProfiler()
+    if search is not None:
+        return search_and_train(dataset, search, profiler=profiler, manifest_name=manifest_name,
+                                **(search_options or {}))
+    if incremental:
+        return train_incremental(dataset, rounds, profiler=profiler, manifest_name=manifest_name)
+    # split into input (X) and output (Y) variables
+    # Heart Disease has 13 features (columns 0-12) and 1 target (column 13)
+    X = dataset[:, 0:13]
+    Y = dataset[:, 13]
+    
+    # Define XGBoost model with optimized parameters
+    model = XGBClassifier(
+        n_estimators=100,           # Number of boosting rounds
+        max_depth=5,                # Maximum tree depth
+        learning_rate=0.1,          # Step size shrinkage
+        random_state=42,            # For reproducibility
+        eval_metric='logloss',      # Evaluation metric
+        use_label_encoder=False     # Suppress warning
+    )
+    
+    # Fit the model
+    fit_timed(model, X, Y, profiler)
+    
+    # Evaluate the model
+    with profiler.phase('evaluate'):
+        accuracy = model.score(X, Y)
+        y_pred = model.predict(X)
+    
+        # Calculate additional metrics
+        from sklearn.metrics import precision_score, recall_score, f1_score
+        precision = precision_score(Y, y_pred, zero_division=0)
+        recall = recall_score(Y, y_pred, zero_division=0)
+        f1 = f1_score(Y, y_pred, zero_division=0)
+    
+    text_out = {
+        "accuracy": float(accuracy),
+        "precision": float(precision),
+        "recall": float(recall),
+        "f1_score": float(f1),
+        "model_type": "XGBoost",
+        "n_estimators": 100,
+        "max_depth": 5
+    }
+    logging.info(text_out)
+    
+    return save_model(model, text_out, profiler, manifest_name)
+
+
+def model_file(manifest_name=MANIFEST_FILE):
+    # model.pkl of the served model, named after the manifest for the others (see registry.artifact_file)
+    return os.path.join(os.getenv('MODEL_REPO') or '.', artifact_file(manifest_name, "model.pkl"))
+
+
+def load_current_model(manifest_name=MANIFEST_FILE):
+    # the model the last training run saved, None if there is none
+    file_path = model_file(manifest_name)
+    if not os.path.exists(file_path):
+        return None
+    with open(file_path, 'rb') as f:
+        model = pickle.load(f)
+    if not isinstance(model, XGBClassifier):
+        logging.warning("Cannot warm-start from %s: not an XGBClassifier", file_path)
+        return None
+    return model
+
+
+def train_incremental(dataset, rounds=None, validation_split=None, seed=42, profiler=None,
+                      manifest_name='model_manifest.json'):
+    """Adds boosting rounds to the saved model, fitted on the new rows in dataset only.
+
+    The existing trees are kept (xgb_model=), so the cost depends on the size of the delta and the number of
+    added rounds, not on the whole history. The new model is only saved if its logloss on a held-out part of
+    the new rows (all of them when validation_split is 0) is no worse than the current model's.
+    """
+    from sklearn.metrics import accuracy_score, log_loss
+
+    profiler = profiler or TrainingProfiler()
+    current = load_current_model(manifest_name)
+    if current is None:
+        logging.warning("No XGBoost model in %s to warm-start from, training from scratch", model_file(manifest_name))
+        text_out = train(dataset, profiler=profiler, manifest_name=manifest_name)
+        text_out.update(warm_start=False, promoted=True)
+        return text_out
+    started = time.perf_counter()
+    rounds = rounds or int(os.getenv('INCREMENTAL_ROUNDS', 20))
+    if validation_split is None:
+        validation_split = float(os.getenv('TRAINING_VALIDATION_SPLIT', 0.2))
+    with profiler.phase('prepare'):
+        X = dataset[:, 0:13]
+        Y = dataset[:, 13]
+        order = np.random.default_rng(seed).permutation(len(X))
+        n_holdout = int(len(X) * validation_split)
+        train_rows = np.sort(order[n_holdout:])
+        holdout_rows = np.sort(order[:n_holdout]) if n_holdout else train_rows
+    with profiler.phase('evaluate'):
+        baseline_loss = log_loss(Y[holdout_rows], current.predict_proba(X[holdout_rows])[:, 1], labels=[0, 1])
+
+    previous_rounds = current.get_booster().num_boosted_rounds()
+    model = XGBClassifier(**dict(current.get_params(), n_estimators=rounds))
+    fit_timed(model, X[train_rows], Y[train_rows], profiler, xgb_model=current.get_booster())
+    with profiler.phase('evaluate'):
+        holdout_proba = model.predict_proba(X[holdout_rows])[:, 1]
+        holdout_loss = log_loss(Y[holdout_rows], holdout_proba, labels=[0, 1])
+    tolerance = float(os.getenv('INCREMENTAL_TOLERANCE', 0.0))
+    promoted = bool(holdout_loss <= baseline_loss * (1 + tolerance))
+
+    text_out = {
+        "model_type": "XGBoost",
+        "warm_start": True,
+        "previous_rounds": previous_rounds,
+        "added_rounds": rounds,
+        "n_estimators": model.get_booster().num_boosted_rounds(),
+        "rows": len(X),
+        "holdout_rows": len(holdout_rows),
+        "baseline_holdout_loss": float(baseline_loss),
+        "holdout_loss": float(holdout_loss),
+        "holdout_accuracy": float(accuracy_score(Y[holdout_rows], holdout_proba > 0.5)),
+        "training_seconds": time.perf_counter() - started,
+        "promoted": promoted,
+    }
+    if not promoted:
+        logging.warning("Warm-started model failed the holdout check (logloss %.4f, was %.4f), keeping the "
+                        "current model", holdout_loss, baseline_loss)
+        return profiler.add_to(text_out)
+    logging.info(text_out)
+    return save_model(model, text_out, profiler, manifest_name)
+
+
+def save_serving_artifacts(model, text_out, model_dir, manifest_name='model_manifest.json'):
+    """Writes the booster in XGBoost's native UBJSON format as model.ubj and a model_manifest.json for it.
+
+    prediction-api loads model.ubj straight into a Booster, without unpickling the scikit-learn wrapper. Another
+    manifest_name gets its own artifact (model_manifest_<name>.json -> model_<name>.ubj).
+    """
+    manifest = {
+        'format': 'xgboost-ubj',
+        'artifact': artifact_file(manifest_name, 'model.ubj'),
+        'features': COLUMNS[:13],
+        'target': COLUMNS[13],
+        'scaler': None,
+        'metrics': text_out,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+    }
+    write_serving_files(model_dir, manifest_name, manifest, model.get_booster().save_model)
+
+
+def save_model(model, text_out, profiler=None, manifest_name='model_manifest.json'):
+    # Saving model in a given location provided as an env. variable
+    profiler = profiler or TrainingProfiler()
+    model_repo = os.getenv('MODEL_REPO')
+    if model_repo:
+        with profiler.phase('save'):
+            os.makedirs(model_repo, exist_ok=True)
+            with open(model_file(manifest_name), 'wb') as f:
+                pickle.dump(model, f)
+            save_serving_artifacts(model, text_out, model_repo, manifest_name)
+        logging.info("Saved the XGBoost model to the location : " + model_repo)
+        return profiler.add_to(text_out)
+    else:
+        with profiler.phase('save'):
+            with open(artifact_file(manifest_name, "model.pkl"), 'wb') as f:
+                pickle.dump(model, f)
+            save_serving_artifacts(model, text_out, '.', manifest_name)
+        return profiler.add_to({'message': 'The XGBoost model was saved locally.'})
+
+
+def search_configs(space, strategy, n_iter, seed):
+    # grid: every combination of the values in space; random: n_iter distinct combinations drawn from it
+    names = sorted(space)
+    sizes = [len(space[name]) for name in names]
+    n_combinations = int(np.prod(sizes))
+    if strategy == 'grid':
+        indices = range(n_combinations)
+    else:
+        rng = np.random.default_rng(seed)
+        indices = rng.choice(n_combinations, size=min(n_iter, n_combinations), replace=False)
+    configs = []
+    for index in indices:
+        # decode the combination number digit by digit, so random search never builds the whole grid
+        config = {}
+        for name, size in zip(reversed(names), reversed(sizes)):
+            index, position = divmod(int(index), size)
+            config[name] = space[name][position]
+        configs.append(dict(sorted(config.items())))
+    return configs
+
+
+def search_and_train(dataset, strategy, space=None, n_iter=20, n_folds=5, num_boost_round=1000,
+                     early_stopping_rounds=20, seed=42, profiler=None, manifest_name='model_manifest.json'):
+    """k-fold cross-validated grid or random search, then refits the best config on all rows and saves it.
+
+    The DMatrix is built once and shared by every trial. Trials run in parallel threads (XGBoost releases the
+    GIL while boosting), and the cores are split between them through each trial's nthread, so the search
+    uses every core without oversubscribing. Each trial grows trees with the hist method until the mean
+    validation logloss has not improved for early_stopping_rounds rounds.
+    """
+    if strategy not in SEARCH_STRATEGIES:
+        raise ValueError(f"unknown search strategy {strategy}, expected one of {SEARCH_STRATEGIES}")
+    profiler = profiler or TrainingProfiler()
+    started = time.perf_counter()
+    X = dataset[:, 0:13]
+    Y = dataset[:, 13]
+    with profiler.phase('prepare'):
+        dtrain = xgb.DMatrix(X, label=Y, nthread=-1)
+    configs = search_configs(space or DEFAULT_SEARCH_SPACE, strategy, n_iter, seed)
+
+    n_cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+    n_parallel = max(1, min(len(configs), int(os.getenv('SEARCH_PARALLEL_TRIALS', n_cores))))
+    trial_threads = max(1, n_cores // n_parallel)
+
+    def run_trial(config):
+        trial_started = time.perf_counter()
+        params = dict(config, objective='binary:logistic', eval_metric=['error', 'logloss'],
+                      tree_method='hist', nthread=trial_threads, seed=seed)
+        # the same seed gives every trial the same stratified folds
+        history = xgb.cv(params, dtrain, num_boost_round=num_boost_round, nfold=n_folds, stratified=True,
+                         early_stopping_rounds=early_stopping_rounds, seed=seed)
+        best = history.iloc[-1]
+        return {
+            'params': config,
+            'n_estimators': len(history),
+            'cv_logloss': float(best['test-logloss-mean']),
+            'cv_logloss_std': float(best['test-logloss-std']),
+            'cv_accuracy': float(1 - best['test-error-mean']),
+            'seconds': time.perf_counter() - trial_started,
+        }
+
+    with profiler.phase('search'), ThreadPoolExecutor(max_workers=n_parallel) as pool:
+        trials = list(pool.map(run_trial, configs))
+    best = min(trials, key=lambda trial: trial['cv_logloss'])
+    search_seconds = time.perf_counter() - started
+    logging.info("Searched %d configs in %.1fs, best %s", len(trials), search_seconds, best['params'])
+
+    model = XGBClassifier(n_estimators=best['n_estimators'], tree_method='hist', random_state=seed,
+                          eval_metric='logloss', **best['params'])
+    # the rows/sec of the profile are those of the refit, the trials' rounds run inside xgb.cv
+    fit_timed(model, X, Y, profiler)
+    text_out = {
+        "model_type": "XGBoost",
+        "search": strategy,
+        "n_folds": n_folds,
+        "n_trials": len(trials),
+        "parallel_trials": n_parallel,
+        "threads_per_trial": trial_threads,
+        "best_params": best['params'],
+        "n_estimators": best['n_estimators'],
+        "cv_accuracy": best['cv_accuracy'],
+        "cv_logloss": best['cv_logloss'],
+        "search_seconds": search_seconds,
+        "trials": trials,
+    }
+    logging.info({key: value for key, value in text_out.items() if key != 'trials'})
+    return save_model(model, text_out, profiler, manifest_name)
+
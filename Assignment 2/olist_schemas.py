@@ -0,0 +1,170 @@
+"""
+Olist tables: declared schemas, locations and a reader shared by ingest.py, pipeline1.py and pipeline2.py.
+
+Ship it with every job:
+    gcloud dataproc jobs submit pyspark pipeline1.py --py-files=olist_schemas.py ...
+
+"""
+
+from pyspark.sql.types import (
+    DoubleType,
+    IntegerType,
+    StringType,
+    StructField,
+    StructType,
+    TimestampType,
+)
+
+# Raw CSVs as downloaded from Kaggle, and the Parquet copy that ingest.py writes once
+RAW_DATA_PATH = "gs://assingment2-raw-data"
+PARQUET_DATA_PATH = "gs://assingment2-processed-data/olist_parquet"
+
+
+def _schema(*fields):
+    # every column is nullable, like the inferred schemas were
+    return StructType([StructField(name, data_type, True) for name, data_type in fields])
+
+
+# table name -> (CSV file, schema). Zip code prefixes stay strings, they have leading zeros.
+# product_name_lenght and product_description_lenght are misspelt in the dataset itself.
+TABLES = {
+    "orders": (
+        "olist_orders_dataset.csv",
+        _schema(
+            ("order_id", StringType()),
+            ("customer_id", StringType()),
+            ("order_status", StringType()),
+            ("order_purchase_timestamp", TimestampType()),
+            ("order_approved_at", TimestampType()),
+            ("order_delivered_carrier_date", TimestampType()),
+            ("order_delivered_customer_date", TimestampType()),
+            ("order_estimated_delivery_date", TimestampType()),
+        ),
+    ),
+    "order_items": (
+        "olist_order_items_dataset.csv",
+        _schema(
+            ("order_id", StringType()),
+            ("order_item_id", IntegerType()),
+            ("product_id", StringType()),
+            ("seller_id", StringType()),
+            ("shipping_limit_date", TimestampType()),
+            ("price", DoubleType()),
+            ("freight_value", DoubleType()),
+        ),
+    ),
+    "order_payments": (
+        "olist_order_payments_dataset.csv",
+        _schema(
+            ("order_id", StringType()),
+            ("payment_sequential", IntegerType()),
+            ("payment_type", StringType()),
+            ("payment_installments", IntegerType()),
+            ("payment_value", DoubleType()),
+        ),
+    ),
+    "order_reviews": (
+        "olist_order_reviews_dataset.csv",
+        _schema(
+            ("review_id", StringType()),
+            ("order_id", StringType()),
+            ("review_score", IntegerType()),
+            ("review_comment_title", StringType()),
+            ("review_comment_message", StringType()),
+            ("review_creation_date", TimestampType()),
+            ("review_answer_timestamp", TimestampType()),
+        ),
+    ),
+    "products": (
+        "olist_products_dataset.csv",
+        _schema(
+            ("product_id", StringType()),
+            ("product_category_name", StringType()),
+            ("product_name_lenght", IntegerType()),
+            ("product_description_lenght", IntegerType()),
+            ("product_photos_qty", IntegerType()),
+            ("product_weight_g", IntegerType()),
+            ("product_length_cm", IntegerType()),
+            ("product_height_cm", IntegerType()),
+            ("product_width_cm", IntegerType()),
+        ),
+    ),
+    "customers": (
+        "olist_customers_dataset.csv",
+        _schema(
+            ("customer_id", StringType()),
+            ("customer_unique_id", StringType()),
+            ("customer_zip_code_prefix", StringType()),
+            ("customer_city", StringType()),
+            ("customer_state", StringType()),
+        ),
+    ),
+    "sellers": (
+        "olist_sellers_dataset.csv",
+        _schema(
+            ("seller_id", StringType()),
+            ("seller_zip_code_prefix", StringType()),
+            ("seller_city", StringType()),
+            ("seller_state", StringType()),
+        ),
+    ),
+    "geolocation": (
+        "olist_geolocation_dataset.csv",
+        _schema(
+            ("geolocation_zip_code_prefix", StringType()),
+            ("geolocation_lat", DoubleType()),
+            ("geolocation_lng", DoubleType()),
+            ("geolocation_city", StringType()),
+            ("geolocation_state", StringType()),
+        ),
+    ),
+    "category_translation": (
+        "product_category_name_translation.csv",
+        _schema(
+            ("product_category_name", StringType()),
+            ("product_category_name_english", StringType()),
+        ),
+    ),
+}
+
+# Extra CSV reader options: review comments contain quoted line breaks
+CSV_OPTIONS = {
+    "order_reviews": {"multiLine": "true", "escape": '"'},
+}
+
+# Metastore database of the bucketed tables ingest.py --buckets N saves, read with --source table
+BUCKETED_DATABASE = "olist"
+
+# Fact tables bucketed (and sorted) on their join key when ingest.py saves bucketed tables. Joining two
+# tables bucketed the same way on that key needs no shuffle
+BUCKET_COLUMNS = {
+    "orders": "order_id",
+    "order_items": "order_id",
+    "order_payments": "order_id",
+}
+
+# Parquet partition columns. Both pipelines filter orders on order_status, which then only reads the
+# directories of the statuses they keep
+PARTITION_COLUMNS = {
+    "orders": ["order_status"],
+}
+
+
+def read_table(spark, name, source="parquet", path=None):
+    """Reads one Olist table, from the Parquet copy (default), the bucketed metastore table or the raw CSV.
+
+    The CSV reader never infers the schema, so each file is scanned once. Column pruning and filter pushdown
+    apply to the Parquet copy: select and filter right after reading and Spark only reads those columns and
+    skips row groups (and order_status partitions) that cannot match.
+    """
+    file_name, schema = TABLES[name]
+    if source == "parquet":
+        return spark.read.parquet(f"{path or PARQUET_DATA_PATH}/{name}")
+    if source == "table":
+        return spark.table(f"{path or BUCKETED_DATABASE}.{name}")
+    if source != "csv":
+        raise ValueError(f"Unknown source {source}, expected parquet, table or csv")
+    reader = spark.read.format("csv").option("header", "true").schema(schema)
+    for key, value in CSV_OPTIONS.get(name, {}).items():
+        reader = reader.option(key, value)
+    return reader.load(f"{path or RAW_DATA_PATH}/{file_name}")
@@ -1,17 +1,30 @@
 """
 Pipeline 1: Product Category Sales Performance
 
+Submit with the shared schemas, after ingest.py has written the Parquet copy:
+    gcloud dataproc jobs submit pyspark pipeline1.py --py-files=olist_schemas.py ...
+
 """
 
-from pyspark import SparkConf
-from pyspark.sql import SparkSession
+import argparse
+
+from pyspark import SparkConf, StorageLevel
+from pyspark.sql import Observation, SparkSession
 from pyspark.sql.functions import (
     col,
     sum,
     count,
     avg,
-    countDistinct,
+    array_distinct,
+    broadcast,
+    collect_list,
+    collect_set,
     date_format,
+    flatten,
+    hll_sketch_agg,
+    hll_sketch_estimate,
+    hll_union_agg,
+    size,
     year,
     month,
     quarter,
@@ -19,12 +32,54 @@ from pyspark.sql.functions import (
     rank,
     percent_rank,
     lag,
+    lit,
     when,
 )
 from pyspark.sql.window import Window
 
+from olist_schemas import read_table
+
+# How the distinct order and product counts are kept while rolling months up to quarters and overall:
+#   exact - the set of ids of every group, merged by concatenating the sets (same result as countDistinct)
+#   hll   - a HyperLogLog sketch per group, merged by a sketch union (fixed size, ~1-2% error with lg k 12)
+DISTINCT_COUNT_MODES = ("exact", "hll")
+
+
+def distinct_state(column, mode):
+    # the distinct ids of one group, in a form that can be merged with other groups
+    return hll_sketch_agg(column) if mode == "hll" else collect_set(column)
+
+
+def merged_state(column, mode):
+    # merges the distinct_state column of the groups rolled up into one
+    return hll_union_agg(column) if mode == "hll" else array_distinct(flatten(collect_list(column)))
+
+
+def distinct_count(state, mode):
+    return (hll_sketch_estimate(state) if mode == "hll" else size(state)).cast("long")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Pipeline 1: Product Category Sales Performance")
+    parser.add_argument("--source", default="parquet", choices=["parquet", "table", "csv"])
+    parser.add_argument("--data-path", default=None, help="defaults to the location of --source in olist_schemas")
+    # count() and show() of the intermediate DataFrames each run a Spark job of their own, off in production
+    parser.add_argument("--diagnostics", action="store_true", help="print row counts and samples of every step")
+    parser.add_argument("--storage-level", default="MEMORY_AND_DISK",
+                        help="StorageLevel of the persisted DataFrames")
+    # 0 turns broadcast joins off, for comparing stage timings with and without them
+    parser.add_argument("--broadcast-threshold-mb", type=int, default=10,
+                        help="broadcast the dimension tables and any join side up to this size")
+    parser.add_argument("--event-log-dir", default=None,
+                        help="write the Spark event log here, for stage_timings.py")
+    parser.add_argument("--distinct-counts", default="exact", choices=DISTINCT_COUNT_MODES,
+                        help="exact sets or HLL sketches for unique_orders and unique_products")
+    return parser.parse_args()
+
 
 def main() -> None:
+    args = parse_args()
+
     sparkConf = SparkConf()
  #   sparkConf.setMaster("spark://spark-master:7077")  # Docker Spark cluster master URL
     sparkConf.setAppName("Pipeline1_CategorySalesPerformance")
@@ -33,9 +88,29 @@ def main() -> None:
     # sparkConf.set("spark.executor.cores", "1")
     # sparkConf.set("spark.driver.cores", "1")
 
+    # Joins: AQE re-plans them from the actual sizes of the shuffle stages and splits skewed order_id
+    # partitions of the sort-merge join (Join 3) into several tasks, so one busy order_id does not hold up
+    # the stage
+    sparkConf.set("spark.sql.adaptive.enabled", "true")
+    sparkConf.set("spark.sql.adaptive.skewJoin.enabled", "true")
+    sparkConf.set("spark.sql.adaptive.skewJoin.skewedPartitionFactor", "5")
+    sparkConf.set("spark.sql.adaptive.skewJoin.skewedPartitionThresholdInBytes", "64MB")
+    broadcast_threshold = f"{args.broadcast_threshold_mb}MB" if args.broadcast_threshold_mb > 0 else "-1"
+    sparkConf.set("spark.sql.autoBroadcastJoinThreshold", broadcast_threshold)
+    sparkConf.set("spark.sql.adaptive.autoBroadcastJoinThreshold", broadcast_threshold)
+
+    # Event log for the Spark UI / history server, parsed by stage_timings.py
+    if args.event_log_dir:
+        sparkConf.set("spark.eventLog.enabled", "true")
+        sparkConf.set("spark.eventLog.dir", args.event_log_dir)
+
     
     #Lab 7 dataproc_example.py
-    spark = SparkSession.builder.config(conf=sparkConf).getOrCreate()
+    builder = SparkSession.builder.config(conf=sparkConf)
+    if args.source == "table":
+        # the bucketed tables of ingest.py --buckets are in the metastore
+        builder = builder.enableHiveSupport()
+    spark = builder.getOrCreate()
 
 
     # Use the Cloud Storage bucket for temporary BigQuery export data used by the connector.
@@ -53,84 +128,65 @@ def main() -> None:
 
    
     # Step 3: Load Data from GCS / local
-    
-    
-    orders = spark.read.format("csv")\
-        .option("header", "true")\
-        .option("inferSchema", "true")\
-        .load("gs://assingment2-raw-data/olist_orders_dataset.csv")
-
-    order_items = spark.read.format("csv")\
-        .option("header", "true")\
-        .option("inferSchema", "true")\
-        .load("gs://assingment2-raw-data/olist_order_items_dataset.csv")
-
-    products = spark.read.format("csv")\
-        .option("header", "true")\
-        .option("inferSchema", "true")\
-        .load("gs://assingment2-raw-data/olist_products_dataset.csv")
-
-    category_translation = spark.read.format("csv")\
-        .option("header", "true")\
-        .option("inferSchema", "true")\
-        .load("gs://assingment2-raw-data/product_category_name_translation.csv")
-
-    print(f"Orders loaded: {orders.count()} records")
-    print(f"Order items loaded: {order_items.count()} records")
-    print(f"Products loaded: {products.count()} records")
-    """
-
-    # Local development paths (from notebook)
-    orders = (
-        spark.read.format("csv")
-        .option("header", "true")
-        .option("inferSchema", "true")
-        .load("/home/jovyan/data/olist_orders_dataset.csv")
-    )
+    # Parquet written once by ingest.py (or --source csv for the raw files with their declared schemas).
+    # Only the columns used below are read; the order_status filter of Step 2 is pushed down to the scan
+    # and prunes the order_status partitions of the orders table.
+    # Local development: --source csv --data-path /home/jovyan/data
+    print("Step 1: Loading datasets...")
 
-    order_items = (
-        spark.read.format("csv")
-        .option("header", "true")
-        .option("inferSchema", "true")
-        .load("/home/jovyan/data/olist_order_items_dataset.csv")
-    )
+    orders = read_table(spark, "orders", args.source, args.data_path)\
+        .select("order_id", "order_status", "order_purchase_timestamp")
 
-    products = (
-        spark.read.format("csv")
-        .option("header", "true")
-        .option("inferSchema", "true")
-        .load("/home/jovyan/data/olist_products_dataset.csv")
-    )
+    order_items = read_table(spark, "order_items", args.source, args.data_path)\
+        .select("order_id", "product_id", "price", "freight_value")
+
+    products = read_table(spark, "products", args.source, args.data_path)\
+        .select("product_id", "product_category_name")
+
+    category_translation = read_table(spark, "category_translation", args.source, args.data_path)
 
-    category_translation = (
-        spark.read.format("csv")
-        .option("header", "true")
-        .option("inferSchema", "true")
-        .load("/home/jovyan/data/product_category_name_translation.csv")
-    )"""
+    if args.diagnostics:
+        print(f"Orders loaded: {orders.count()} records")
+        print(f"Order items loaded: {order_items.count()} records")
+        print(f"Products loaded: {products.count()} records")
 
     
     print("\nStep 2: Cleaning data...")
 
+    # Row counts are collected as observed metrics while the BigQuery writes run, not by count() jobs.
+    # They are observed after the filters, which keeps the filters pushed down into the scans.
+    clean_orders_metrics = Observation("clean_orders")
+    clean_items_metrics = Observation("clean_order_items")
+    full_data_metrics = Observation("full_data")
+
     # Pattern: Lab 7 dataproc_example.py - df.where(df.Country == "France")
-    orders_clean = orders.where(orders.order_status == "delivered")
+    orders_clean = orders.where(orders.order_status == "delivered")\
+        .observe(clean_orders_metrics, count(lit(1)).alias("rows"))
 
     # Pattern: Lab 7 - using col() and isNotNull() for null filtering
     order_items_clean = order_items.where(
         col("order_id").isNotNull()
         & col("product_id").isNotNull()
         & col("price").isNotNull()
-    )
+    ).observe(clean_items_metrics, count(lit(1)).alias("rows"))
 
     products_clean = products.where(col("product_category_name").isNotNull())
 
-    print(f"Clean orders: {orders_clean.count()}")
-    print(f"Clean order items: {order_items_clean.count()}")
+    if args.diagnostics:
+        print(f"Clean orders: {orders_clean.count()}")
+        print(f"Clean order items: {order_items_clean.count()}")
 
     # Step 5: Join Operations
 
     print("\nStep 3: Joining datasets...")
 
+    # The product (33k rows) and category translation (71 rows) dimensions are broadcast to every executor:
+    # Joins 1 and 2 then run where the order_items rows are, without shuffling them. The order_items side
+    # also keeps its order_id bucketing (--source table) into Join 3
+    if args.broadcast_threshold_mb > 0:
+        products_clean = broadcast(products_clean)
+        category_translation = broadcast(category_translation)
+
     # Join 1: Order items with products
    
     items_products = order_items_clean.join(
@@ -167,8 +223,9 @@ def main() -> None:
         "inner",
     )
 
-    print(f"Final joined dataset: {full_data.count()} records")
-    full_data.show(5)
+    if args.diagnostics:
+        print(f"Final joined dataset: {full_data.count()} records")
+        full_data.show(5)
 
    
     print("\nStep 4: Creating time-based features...")
@@ -200,21 +257,55 @@ def main() -> None:
         ),
     )
 
-    full_data.select("order_id", "category_final", "year_month", "total_revenue").show(
-        5
+    full_data = full_data.observe(
+        full_data_metrics,
+        count(lit(1)).alias("rows"),
+        sum("total_revenue").alias("total_revenue"),
     )
 
-    # Step 7: Aggregations - Monthly Category Sales
+    storage_level = getattr(StorageLevel, args.storage_level)
+    if args.diagnostics:
+        # The aggregation below reads full_data once. The diagnostics read it again, so it is persisted
+        # for them, and a full pass comes first: a show() alone would cache and observe only the
+        # partitions it reads
+        full_data = full_data.persist(storage_level)
+        print(f"Persisted full_data: {full_data.count()} records")
+        full_data.select("order_id", "category_final", "year_month", "total_revenue").show(
+            5
+        )
+
+    # Step 7: Aggregations - one pass over full_data
+    # full_data is aggregated once, at the finest grain (month and category); the monthly, overall and
+    # quarterly tables are rolled up from that small result instead of each shuffling full_data again.
+    # Sums and counts add up across months, averages are kept as sum and count, and the distinct order
+    # and product ids as mergeable states (exact sets or HLL sketches, --distinct-counts)
 
-    print("\nStep 5: Aggregating monthly category sales...")
+    print("\nStep 5: Aggregating sales per month and category...")
 
-    monthly_category_sales = full_data.groupBy("year_month", "category_final").agg(
+    mode = args.distinct_counts
+    category_month = full_data.groupBy("year_month", "year", "quarter", "category_final").agg(
         sum("total_revenue").alias("total_revenue"),
         count("order_id").alias("total_orders"),
-        avg("price").alias("avg_price"),
+        count("*").alias("total_items_sold"),
+        sum("price").alias("price_sum"),
+        count("price").alias("price_count"),
         sum("freight_value").alias("total_freight"),
-        countDistinct("order_id").alias("unique_orders"),
-        countDistinct("product_id").alias("unique_products"),
+        distinct_state("order_id", mode).alias("order_ids"),
+        distinct_state("product_id", mode).alias("product_ids"),
+    )
+
+    # persisted for the monthly, overall and quarterly rollups and the window steps built on them
+    category_month = category_month.persist(storage_level)
+
+    monthly_category_sales = category_month.select(
+        "year_month",
+        "category_final",
+        "total_revenue",
+        "total_orders",
+        (col("price_sum") / col("price_count")).alias("avg_price"),
+        "total_freight",
+        distinct_count(col("order_ids"), mode).alias("unique_orders"),
+        distinct_count(col("product_ids"), mode).alias("unique_products"),
     )
 
     #Lab 8 - orderBy() with desc() for descending order
@@ -222,30 +313,32 @@ def main() -> None:
         "year_month", desc("total_revenue")
     )
 
-    print(
-        f"Monthly category sales aggregated: {monthly_category_sales.count()} records"
-    )
-    monthly_category_sales.show(20)
+    if args.diagnostics:
+        print(
+            f"Monthly category sales aggregated: {monthly_category_sales.count()} records"
+        )
+        monthly_category_sales.show(20)
 
     # Step 8: Aggregations - Top Categories Overall
 
     print("Step 6: Calculating overall top categories")
 
     top_categories = (
-        full_data.groupBy("category_final")
+        category_month.groupBy("category_final")
         .agg(
             sum("total_revenue").alias("total_revenue"),
-            count("*").alias("total_items_sold"),
-            countDistinct("order_id").alias("unique_orders"),
-            avg("price").alias("avg_price"),
-            countDistinct("product_id").alias("unique_products"),
+            sum("total_items_sold").alias("total_items_sold"),
+            distinct_count(merged_state("order_ids", mode), mode).alias("unique_orders"),
+            (sum("price_sum") / sum("price_count")).alias("avg_price"),
+            distinct_count(merged_state("product_ids", mode), mode).alias("unique_products"),
         )
         .orderBy(desc("total_revenue"))
     )
 
-    print(f"Top categories calculated: {top_categories.count()} categories")
-    print("\n=== TOP 10 CATEGORIES ===")
-    top_categories.show(10, truncate=False)
+    if args.diagnostics:
+        print(f"Top categories calculated: {top_categories.count()} categories")
+        print("\n=== TOP 10 CATEGORIES ===")
+        top_categories.show(10, truncate=False)
 
    
     # Step 9: Window Functions - Category Rankings
@@ -264,10 +357,11 @@ def main() -> None:
     )
 
     print("Category rankings calculated")
-    print("\n=== TOP 5 CATEGORIES PER MONTH ===")
-    monthly_ranked.where(col("rank_in_month") <= 5).orderBy(
-        "year_month", "rank_in_month"
-    ).show(50, truncate=False)
+    if args.diagnostics:
+        print("\n=== TOP 5 CATEGORIES PER MONTH ===")
+        monthly_ranked.where(col("rank_in_month") <= 5).orderBy(
+            "year_month", "rank_in_month"
+        ).show(50, truncate=False)
 
     # Step 10: Window Functions - Moving Averages
     print("\nStep 8: Calculating 3-month moving averages...")
@@ -289,10 +383,11 @@ def main() -> None:
     )
 
     print("Moving averages calculated")
-    # Show example for one category
-    monthly_trends.where(col("category_final") == "furniture_decor").orderBy(
-        "year_month"
-    ).show(20, truncate=False)
+    if args.diagnostics:
+        # Show example for one category
+        monthly_trends.where(col("category_final") == "furniture_decor").orderBy(
+            "year_month"
+        ).show(20, truncate=False)
 
     # Step 11: Window Functions - Growth Rate
     
@@ -312,27 +407,29 @@ def main() -> None:
     )
 
     print("Growth rates calculated")
-    print("\n=== HIGH GROWTH CATEGORIES (Last Month) ===")
-    monthly_growth.where(col("growth_rate") > 50).orderBy(
-        desc("growth_rate")
-    ).show(20, truncate=False)
+    if args.diagnostics:
+        print("\n=== HIGH GROWTH CATEGORIES (Last Month) ===")
+        monthly_growth.where(col("growth_rate") > 50).orderBy(
+            desc("growth_rate")
+        ).show(20, truncate=False)
 
   
     # Step 12: Quarterly Aggregation
     print("\nStep 10: Aggregating quarterly sales...")
 
     quarterly_sales = (
-        full_data.groupBy("year", "quarter", "category_final")
+        category_month.groupBy("year", "quarter", "category_final")
         .agg(
             sum("total_revenue").alias("total_revenue"),
-            count("order_id").alias("total_orders"),
-            avg("price").alias("avg_price"),
+            sum("total_orders").alias("total_orders"),
+            (sum("price_sum") / sum("price_count")).alias("avg_price"),
         )
         .orderBy("year", "quarter", desc("total_revenue"))
     )
 
-    print(f"Quarterly sales aggregated: {quarterly_sales.count()} records")
-    quarterly_sales.show(20)
+    if args.diagnostics:
+        print(f"Quarterly sales aggregated: {quarterly_sales.count()} records")
+        quarterly_sales.show(20)
 
     # Step 13: Write Results to BigQuery
     # Form file Lab 7 Lab7_4.ipynb 
@@ -357,8 +454,17 @@ def main() -> None:
 
     print("✓ Written: category_quarterly_sales")
 
+    category_month.unpersist()
+    full_data.unpersist()
+
 
+    # Observed while the writes ran, reading them starts no job
     print("\nPipeline 1 completed successfully!")
+    print("Summary:")
+    print(f"  - Clean orders: {clean_orders_metrics.get['rows']}")
+    print(f"  - Clean order items: {clean_items_metrics.get['rows']}")
+    print(f"  - Joined order items: {full_data_metrics.get['rows']}")
+    print(f"  - Total revenue: {full_data_metrics.get['total_revenue']:.2f}")
     
 
     # Stop the Spark context
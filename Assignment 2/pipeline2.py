@@ -1,18 +1,20 @@
 """
 Pipeline 2: Payment Behavior & Installment Analysis (Lab Style)
 
+Submit with the shared schemas, after ingest.py has written the Parquet copy:
+    gcloud dataproc jobs submit pyspark pipeline2.py --py-files=olist_schemas.py ...
+
 """
 
-from pathlib import Path
+import argparse
 
-from pyspark import SparkConf
-from pyspark.sql import SparkSession
+from pyspark import SparkConf, StorageLevel
+from pyspark.sql import Observation, SparkSession
 from pyspark.sql.functions import (
     col,
     sum,
     count,
     avg,
-    countDistinct,
     min,
     max,
     date_format,
@@ -22,12 +24,48 @@ from pyspark.sql.functions import (
     hour,
     desc,
     lag,
+    lit,
     when,
 )
 from pyspark.sql.window import Window
 
+from olist_schemas import read_table
+
+# Grouping columns of the single aggregation pass, and the grouping sets computed from them. The payment type
+# summary is rolled up from the (payment_type, order_id) set: its row count is the number of distinct orders,
+# without a count(DISTINCT), which Spark would evaluate for every grouping set
+GROUPING_COLUMNS = ("payment_type", "order_id", "year_month", "payment_range", "installment_category", "hour")
+GROUPING_SETS = {
+    "payment_type_order": ("payment_type", "order_id"),
+    "month": ("year_month", "payment_type"),
+    "installments": ("payment_range", "installment_category"),
+    "hour": ("hour", "payment_type"),
+}
+
+
+def grouping_set_id(columns):
+    # the value grouping_id(*GROUPING_COLUMNS) takes on the rows of a grouping set: one bit per grouping
+    # column, the first one the most significant, set when the column is not grouped on
+    grouping_id = 0
+    for column in GROUPING_COLUMNS:
+        grouping_id = grouping_id << 1 | (column not in columns)
+    return grouping_id
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Pipeline 2: Payment Behavior & Installment Analysis")
+    parser.add_argument("--source", default="parquet", choices=["parquet", "table", "csv"])
+    parser.add_argument("--data-path", default=None, help="defaults to the location of --source in olist_schemas")
+    # count() and show() of the intermediate DataFrames each run a Spark job of their own, off in production
+    parser.add_argument("--diagnostics", action="store_true", help="print row counts and samples of every step")
+    parser.add_argument("--storage-level", default="MEMORY_AND_DISK",
+                        help="StorageLevel of the persisted DataFrames")
+    return parser.parse_args()
+
 
 def main() -> None:
+    args = parse_args()
+
    
     # STEP 0: IMPORTS + SPARK SESSION
  
@@ -37,7 +75,12 @@ def main() -> None:
     sparkConf.setAppName("Pipeline2_PaymentAnalysis")
 
 
-    spark = SparkSession.builder.master("yarn").config(conf=sparkConf).getOrCreate()
+    builder = SparkSession.builder.master("yarn").config(conf=sparkConf)
+    if args.source == "table":
+        # the bucketed tables of ingest.py --buckets are in the metastore; orders and payments are both
+        # bucketed on order_id, so the join below needs no shuffle
+        builder = builder.enableHiveSupport()
+    spark = builder.getOrCreate()
 
 
     # Step 2: GCS Configuration for BigQuery
@@ -59,60 +102,49 @@ def main() -> None:
     )
 
   
-    # STEP 1: LOAD DATA (Lab 7 Lab7_3.ipynb CSV reader)
-    # Lab 7 Lab7_5.ipynb -  GCS file path
-    print("Step 1: Loading datasets from Google Cloud Storage...")
-
-    # Load data from GCS (for Dataproc)
-    orders = spark.read.format("csv")\
-        .option("header", "true")\
-        .option("inferSchema", "true")\
-        .load("gs://assingment2-raw-data/olist_orders_dataset.csv")
-
-    payments = spark.read.format("csv")\
-        .option("header", "true")\
-        .option("inferSchema", "true")\
-        .load("gs://assingment2-raw-data/olist_order_payments_dataset.csv")
-
-    """
-    # Local development paths (for Docker/local runs)
-    base_data_path = Path("/home/jovyan/data/sample")
-    orders = (
-        spark.read.format("csv")
-        .option("header", "true")
-        .option("inferSchema", "true")
-        .load(str(base_data_path / "olist_orders_dataset.csv"))
-    )
+    # STEP 1: LOAD DATA
+    # Parquet written once by ingest.py (or --source csv for the raw files with their declared schemas).
+    # Only the columns used below are read, and the filters of STEP 2 are pushed down to the scans: the
+    # order_status filter prunes the order_status partitions of orders, payment_value > 0 skips row groups.
+    # Local development: --source csv --data-path /home/jovyan/data/sample
+    print("Step 1: Loading datasets...")
 
-    payments = (
-        spark.read.format("csv")
-        .option("header", "true")
-        .option("inferSchema", "true")
-        .load(str(base_data_path / "olist_order_payments_dataset.csv"))
-    )
-    """
+    orders = read_table(spark, "orders", args.source, args.data_path)\
+        .select("order_id", "order_status", "order_purchase_timestamp")
+
+    payments = read_table(spark, "order_payments", args.source, args.data_path)
 
-    print(f"Orders rows: {orders.count()}")
-    print(f"Payments rows: {payments.count()}")
+    if args.diagnostics:
+        print(f"Orders rows: {orders.count()}")
+        print(f"Payments rows: {payments.count()}")
 
-    # Quick schema peek (Lab 7 habit: print schema + a few rows)
-    orders.printSchema()
-    payments.printSchema()
-    orders.show(5)
-    payments.show(5)
+        # Quick schema peek (Lab 7 habit: print schema + a few rows)
+        orders.printSchema()
+        payments.printSchema()
+        orders.show(5)
+        payments.show(5)
 
     # STEP 2: CLEAN DATA (Lab 8 BasicDF filters)
     # Similar Lab 8 BasicDF_1.ipynb (`where`, `isin`, comparison ops)
     print("Filtering valid orders + payments...")
 
+    # Row counts are collected as observed metrics while the BigQuery writes run, not by count() jobs.
+    # They are observed after the filters, which keeps the filters pushed down into the scans.
+    clean_orders_metrics = Observation("clean_orders")
+    clean_payments_metrics = Observation("clean_payments")
+    full_data_metrics = Observation("full_data")
+    payment_types_metrics = Observation("payment_types")
+
     orders_clean = orders.where(
         col("order_status").isin(["delivered", "invoiced", "shipped"])
-    )
+    ).observe(clean_orders_metrics, count(lit(1)).alias("rows"))
 
-    payments_clean = payments.where(col("payment_value") > 0)
+    payments_clean = payments.where(col("payment_value") > 0)\
+        .observe(clean_payments_metrics, count(lit(1)).alias("rows"))
 
-    print(f"Clean orders: {orders_clean.count()}")
-    print(f"Clean payments: {payments_clean.count()}")
+    if args.diagnostics:
+        print(f"Clean orders: {orders_clean.count()}")
+        print(f"Clean payments: {payments_clean.count()}")
 
    
     # STEP 3: SINGLE JOIN (Lab 8 AdvancedDF join)
@@ -125,8 +157,9 @@ def main() -> None:
         "inner",
     )
 
-    print(f"Joined rows: {full_data.count()}")
-    full_data.select("order_id", "payment_type", "payment_value").show(5)
+    if args.diagnostics:
+        print(f"Joined rows: {full_data.count()}")
+        full_data.select("order_id", "payment_type", "payment_value").show(5)
 
    
     # STEP 4: TIME FEATURES (Lab 8 BasicDF_2 date functions)
@@ -155,12 +188,11 @@ def main() -> None:
         )
     )
 
-    full_data.select("order_id", "year_month", "day_of_week", "hour").show(5)
+    if args.diagnostics:
+        full_data.select("order_id", "year_month", "day_of_week", "hour").show(5)
 
   
     # STEP 5: PAYMENT RANGE + INSTALLMENT LABELS (Lab 8 when/otherwise)
-  
-    )
 
     full_data = (
         full_data.withColumn(
@@ -206,108 +238,143 @@ def main() -> None:
         )
     )
 
-    full_data.select(
-        "order_id",
-        "payment_range",
-        "installment_category",
-        "monthly_installment_amount",
-    ).show(5)
+    full_data = full_data.observe(
+        full_data_metrics,
+        count(lit(1)).alias("rows"),
+        sum("payment_value").alias("total_value"),
+    )
 
-    # STEP 6: PAYMENT TYPE SUMMARY (Lab 8 AdvancedDF groupBy + agg)
-    # from: Lab 8 
-    
-    print("Aggregation 1 → payment type distribution...")
+    storage_level = getattr(StorageLevel, args.storage_level)
+    if args.diagnostics:
+        # The aggregation below reads full_data once. The diagnostics read it again, so it is persisted
+        # for them, and a full pass comes first: a show() alone would cache and observe only the
+        # partitions it reads
+        full_data = full_data.persist(storage_level)
+        print(f"Persisted full_data: {full_data.count()} records")
+        full_data.select(
+            "order_id",
+            "payment_range",
+            "installment_category",
+            "monthly_installment_amount",
+        ).show(5)
+
+    # STEP 6: AGGREGATIONS - one pass over full_data (GROUPING SETS)
+    # The five aggregations group by four different keys (monthly_payments and cash_flow share theirs).
+    # One GROUP BY GROUPING SETS computes all four from a single scan and shuffle of full_data; the rows
+    # of each set are told apart by grouping_id, and each table below selects its set and columns.
+    # The DataFrame API has no grouping sets before Spark 4.0, so this step is SQL over a temp view.
+
+    print("Aggregating payment types, months, installments and hours in one pass...")
+
+    full_data.createOrReplaceTempView("payments")
+    payment_aggregates = spark.sql(
+        f"""
+        SELECT
+            {", ".join(GROUPING_COLUMNS)},
+            grouping_id({", ".join(GROUPING_COLUMNS)}) AS grouping_set,
+            count(*) AS transaction_count,
+            sum(payment_value) AS total_value,
+            avg(payment_value) AS avg_value,
+            min(payment_value) AS min_value,
+            max(payment_value) AS max_value,
+            avg(payment_installments) AS avg_installments,
+            sum(payment_installments) AS installments_sum,
+            count(payment_installments) AS installments_count,
+            sum(monthly_installment_amount) AS estimated_monthly_cash_inflow
+        FROM payments
+        GROUP BY GROUPING SETS ({", ".join(f"({', '.join(columns)})" for columns in GROUPING_SETS.values())})
+        """
+    )
+
+    # one row per group of every set, per order for the payment types: persisted for the five tables and
+    # the window steps
+    payment_aggregates = payment_aggregates.persist(storage_level)
+
+    def grouping_set(name):
+        return payment_aggregates.where(col("grouping_set") == grouping_set_id(GROUPING_SETS[name]))
 
+    # Aggregation 1: payment type distribution (Lab 8 AdvancedDF groupBy + agg)
+    # rolled up from one row per payment type and order: sums, counts, minima and maxima add up, the
+    # averages are recomputed from sums and counts, and every row is one distinct order
     payment_types = (
-        full_data.groupBy("payment_type")
+        grouping_set("payment_type_order").groupBy("payment_type")
         .agg(
-            count("*").alias("transaction_count"),
-            countDistinct("order_id").alias("unique_orders"),
-            sum("payment_value").alias("total_value"),
-            avg("payment_value").alias("avg_value"),
-            min("payment_value").alias("min_value"),
-            max("payment_value").alias("max_value"),
-            avg("payment_installments").alias("avg_installments"),
+            sum("transaction_count").alias("transaction_count"),
+            count("*").alias("unique_orders"),
+            sum("total_value").alias("total_value"),
+            (sum("total_value") / sum("transaction_count")).alias("avg_value"),
+            min("min_value").alias("min_value"),
+            max("max_value").alias("max_value"),
+            (sum("installments_sum") / sum("installments_count")).alias("avg_installments"),
         )
         .orderBy(desc("transaction_count"))
+        .observe(payment_types_metrics, count(lit(1)).alias("rows"))
     )
 
-    payment_types.show(truncate=False)
-
-   
-    # STEP 7: MONTHLY PAYMENT TRENDS (Lab 8 multi-column groupBy)
-    # Ffrom Lab 8 AdvancedDF aggregation on InvoiceNo + CustomerId
-    
-    print("Aggregation 2 → monthly payment trends by type...")
+    if args.diagnostics:
+        payment_types.show(truncate=False)
 
+    # Aggregation 2: monthly payment trends by type (Lab 8 multi-column groupBy)
     monthly_payments = (
-        full_data.groupBy("year_month", "payment_type")
-        .agg(
-            count("*").alias("transaction_count"),
-            sum("payment_value").alias("total_value"),
-            avg("payment_value").alias("avg_value"),
-            avg("payment_installments").alias("avg_installments"),
+        grouping_set("month").select(
+            "year_month",
+            "payment_type",
+            "transaction_count",
+            "total_value",
+            "avg_value",
+            "avg_installments",
         )
         .orderBy("year_month", "payment_type")
     )
 
-    monthly_payments.show(20, truncate=False)
-
-    
-    # STEP 8: INSTALLMENT PATTERNS (Lab 8 groupBy + agg)
-    #  from: Lab 8 multi-key aggregation examples
-    print("Aggregation 3 → installment behavior by payment range...")
+    if args.diagnostics:
+        monthly_payments.show(20, truncate=False)
 
+    # Aggregation 3: installment behavior by payment range
     installment_patterns = (
-        full_data.groupBy("payment_range", "installment_category")
-        .agg(
-            count("*").alias("transaction_count"),
-            avg("payment_installments").alias("avg_installments"),
-            sum("payment_value").alias("total_value"),
-            avg("payment_value").alias("avg_value"),
+        grouping_set("installments").select(
+            "payment_range",
+            "installment_category",
+            "transaction_count",
+            "avg_installments",
+            "total_value",
+            "avg_value",
         )
         .orderBy("payment_range", "installment_category")
     )
 
-    installment_patterns.show(20, truncate=False)
-
-    
-    # STEP 9: TEMPORAL PATTERNS (Lab 8 aggregations)
-    # Similarfrom: Lab 8 hourly grouping demos
-    
-    print("Aggregation 4 → hourly payment behavior per type...")
+    if args.diagnostics:
+        installment_patterns.show(20, truncate=False)
 
+    # Aggregation 4: hourly payment behavior per type
     hourly_patterns = (
-        full_data.groupBy("hour", "payment_type")
-        .agg(
-            count("*").alias("transaction_count"),
-            avg("payment_value").alias("avg_value"),
+        grouping_set("hour").select(
+            "hour",
+            "payment_type",
+            "transaction_count",
+            "avg_value",
         )
         .orderBy("hour", "payment_type")
     )
 
-    hourly_patterns.show(24, truncate=False)
-
-    
-    # STEP 10: CASH FLOW ESTIMATE (Lab 8 sum over groupBy)
-    # Simiilar to Lab 8 revenue aggregation + derived columns
-
-    print("Aggregation 5 → monthly cash flow (order value vs. installment inflow)...")
+    if args.diagnostics:
+        hourly_patterns.show(24, truncate=False)
 
+    # Aggregation 5: monthly cash flow (order value vs. installment inflow), same groups as aggregation 2
     cash_flow = (
-        full_data.groupBy("year_month", "payment_type")
-        .agg(
-            sum("payment_value").alias("total_order_value"),
-            sum("monthly_installment_amount").alias(
-                "estimated_monthly_cash_inflow"
-            ),
-            count("*").alias("transaction_count"),
-            avg("payment_installments").alias("avg_installments"),
+        grouping_set("month").select(
+            col("year_month"),
+            col("payment_type"),
+            col("total_value").alias("total_order_value"),
+            col("estimated_monthly_cash_inflow"),
+            col("transaction_count"),
+            col("avg_installments"),
         )
         .orderBy("year_month", "payment_type")
     )
 
-    cash_flow.show(20, truncate=False)
+    if args.diagnostics:
+        cash_flow.show(20, truncate=False)
 
     # STEP 11: WINDOW FUNCTIONS (running totals + moving averages)
     # from: Lab 8 AdvancedDF window spec + rowsBetween(-2, 0)
@@ -331,7 +398,8 @@ def main() -> None:
         )
     )
 
-    payment_trends.show(20, truncate=False)
+    if args.diagnostics:
+        payment_trends.show(20, truncate=False)
 
     #Lab 8 AdvancedDF lag() growth calculation
     print("Window 2 → month-over-month growth by payment_type...")
@@ -346,13 +414,14 @@ def main() -> None:
         ((col("total_value") - col("prev_month_value")) / col("prev_month_value") * 100),
     )
 
-    payment_growth.select(
-        "year_month",
-        "payment_type",
-        "total_value",
-        "prev_month_value",
-        "growth_rate",
-    ).show(20, truncate=False)
+    if args.diagnostics:
+        payment_growth.select(
+            "year_month",
+            "payment_type",
+            "total_value",
+            "prev_month_value",
+            "growth_rate",
+        ).show(20, truncate=False)
 
 
     
@@ -399,10 +468,17 @@ def main() -> None:
     print("✓ Written: payment_growth_trends")
 
    
+    payment_aggregates.unpersist()
+    full_data.unpersist()
+
+    # Observed while the writes ran, reading them starts no job
     print("\nPipeline 2 completed successfully!")
     print("Summary:")
-    print(f"  - Processed {full_data.count()} payment transactions")
-    print(f"  - Analyzed {payment_types.count()} payment types")
+    print(f"  - Clean orders: {clean_orders_metrics.get['rows']}")
+    print(f"  - Clean payments: {clean_payments_metrics.get['rows']}")
+    print(f"  - Processed {full_data_metrics.get['rows']} payment transactions")
+    print(f"  - Total payment value: {full_data_metrics.get['total_value']:.2f}")
+    print(f"  - Analyzed {payment_types_metrics.get['rows']} payment types")
     print(f"  - Generated monthly, hourly, and installment pattern metrics")
 
     # Stop the Spark context
@@ -0,0 +1,131 @@
+"""
+Stage timings from Spark event logs: wall time, tasks, input and shuffle volume of every stage
+
+Run a pipeline with --event-log-dir (or take the log from the history server of the Dataproc cluster),
+copy the log locally and compare runs, e.g. without and with broadcast joins:
+    gsutil cp gs://.../spark-events/application_..._0001 before.log
+    python stage_timings.py before.log after.log
+
+Uncompressed logs only (spark.eventLog.compress=false, the default); a rolling event log directory
+(eventlog_v2_...) is read file by file.
+
+"""
+
+import argparse
+import json
+import os
+from collections import defaultdict
+
+MB = 1024 * 1024
+
+# summed from the task end events, zero for a stage without any (skipped, no tasks or a truncated log)
+TASK_TOTALS = ("input_bytes", "shuffle_read_bytes", "shuffle_write_bytes", "executor_run_ms")
+
+
+def read_events(path):
+    # one JSON event per line; a rolling log is a directory of events_<n>_... files
+    if os.path.isdir(path):
+        files = sorted(
+            (name for name in os.listdir(path) if name.startswith("events_")),
+            key=lambda name: int(name.split("_")[1]),
+        )
+        paths = [os.path.join(path, name) for name in files]
+    else:
+        paths = [path]
+    for file_path in paths:
+        with open(file_path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def stage_timings(path):
+    """Returns (application name, list of completed stages) of one event log."""
+    app_name = os.path.basename(path)
+    stages = {}
+    task_totals = defaultdict(lambda: defaultdict(int))
+    for event in read_events(path):
+        kind = event["Event"]
+        if kind == "SparkListenerApplicationStart":
+            app_name = event.get("App Name", app_name)
+        elif kind == "SparkListenerTaskEnd":
+            metrics = event.get("Task Metrics") or {}
+            totals = task_totals[(event["Stage ID"], event["Stage Attempt ID"])]
+            totals["input_bytes"] += metrics.get("Input Metrics", {}).get("Bytes Read", 0)
+            shuffle_read = metrics.get("Shuffle Read Metrics", {})
+            totals["shuffle_read_bytes"] += shuffle_read.get("Remote Bytes Read", 0) + shuffle_read.get(
+                "Local Bytes Read", 0
+            )
+            shuffle_write = metrics.get("Shuffle Write Metrics", {})
+            totals["shuffle_write_bytes"] += shuffle_write.get("Shuffle Bytes Written", 0)
+            totals["executor_run_ms"] += metrics.get("Executor Run Time", 0)
+        elif kind == "SparkListenerStageCompleted":
+            info = event["Stage Info"]
+            if "Submission Time" not in info or "Completion Time" not in info:
+                continue
+            stages[(info["Stage ID"], info["Stage Attempt ID"])] = {
+                "stage_id": info["Stage ID"],
+                "attempt": info["Stage Attempt ID"],
+                "name": info["Stage Name"],
+                "tasks": info["Number of Tasks"],
+                "seconds": (info["Completion Time"] - info["Submission Time"]) / 1000,
+                "failed": "Failure Reason" in info,
+            }
+    for key, stage in stages.items():
+        stage.update(dict.fromkeys(TASK_TOTALS, 0))
+        stage.update(task_totals[key])
+    return app_name, sorted(stages.values(), key=lambda stage: (stage["stage_id"], stage["attempt"]))
+
+
+def totals(stages):
+    return {
+        "stages": len(stages),
+        "tasks": sum(stage["tasks"] for stage in stages),
+        "seconds": sum(stage["seconds"] for stage in stages),
+        "executor_run_ms": sum(stage["executor_run_ms"] for stage in stages),
+        "input_bytes": sum(stage["input_bytes"] for stage in stages),
+        "shuffle_read_bytes": sum(stage["shuffle_read_bytes"] for stage in stages),
+        "shuffle_write_bytes": sum(stage["shuffle_write_bytes"] for stage in stages),
+    }
+
+
+def print_stages(app_name, stages, top):
+    print(f"\n=== {app_name} ===")
+    print(f"{'stage':>6} {'tasks':>6} {'seconds':>8} {'input MB':>9} {'shuf rd MB':>11} {'shuf wr MB':>11}  name")
+    for stage in sorted(stages, key=lambda stage: -stage["seconds"])[:top]:
+        stage_id = f"{stage['stage_id']}.{stage['attempt']}" if stage["attempt"] else str(stage["stage_id"])
+        print(
+            f"{stage_id:>6} {stage['tasks']:>6} {stage['seconds']:>8.2f} {stage['input_bytes'] / MB:>9.1f} "
+            f"{stage['shuffle_read_bytes'] / MB:>11.1f} {stage['shuffle_write_bytes'] / MB:>11.1f}  "
+            f"{stage['name'][:60]}{' (failed)' if stage['failed'] else ''}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Stage timings from Spark event logs")
+    parser.add_argument("event_logs", nargs="+", help="event log files, e.g. a run before and after a change")
+    parser.add_argument("--top", type=int, default=20, help="slowest stages listed per log")
+    args = parser.parse_args()
+
+    runs = []
+    for path in args.event_logs:
+        app_name, stages = stage_timings(path)
+        print_stages(app_name, stages, args.top)
+        runs.append((path, totals(stages)))
+
+    # Stage seconds add up stages that ran concurrently, so compare them between runs rather than
+    # reading them as the job's wall time
+    print(
+        f"\n{'event log':<40} {'stages':>7} {'tasks':>7} {'stage s':>8} {'exec s':>8} "
+        f"{'shuf rd MB':>11} {'shuf wr MB':>11}"
+    )
+    for path, run in runs:
+        print(
+            f"{os.path.basename(path)[:40]:<40} {run['stages']:>7} {run['tasks']:>7} {run['seconds']:>8.1f} "
+            f"{run['executor_run_ms'] / 1000:>8.1f} {run['shuffle_read_bytes'] / MB:>11.1f} "
+            f"{run['shuffle_write_bytes'] / MB:>11.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()